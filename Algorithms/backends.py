@@ -0,0 +1,226 @@
+'''
+Description: Registry of the depth completion backends, so that the
+pipeline picks one by name. Every backend fills a reduced depth frame and
+returns (filled depth, confidence), optionally timing every call.
+
+Backends either work on the samples drawn by createSamples (voronoi,
+natural_neighbor, ...) or on every valid pixel of the frame (push_pull,
+discretize).
+'''
+
+import numpy as np
+import time
+import logging
+from scipy.ndimage import distance_transform_edt
+from create_samples import createSamples
+from voronoi import getVoronoi, getVoronoiRaster, getVoronoiMapped
+from push_pull import pushPull
+from discretize import depthCompletion
+import natural_neighbor
+import linear_interpolation
+import rbf_interpolation
+
+class Backend:
+    """
+    One depth completion method
+    """
+    def __init__(self, name, fill, cost, cached, samples):
+        """
+        Initializes Backend object
+
+        Args:
+            name: Name the backend is selected by
+            fill: Function taking (depth, samples, vec, plan) and returning
+            (filled depth, confidence)
+            cost: Rough cost class, 'low', 'medium' or 'high'
+            cached: Whether state is reused across frames through the plan
+            (sampling pattern, weights, factorizations)
+            samples: Whether the backend works on samples, otherwise it
+            uses the whole frame and samples and vec are None
+        """
+        self.name = name
+        self.fill = fill
+        self.cost = cost
+        self.cached = cached
+        self.samples = samples
+        self.failures = 0
+
+    def __str__(self):
+        return '{0} (cost: {1}, cached: {2})'.format(self.name, self.cost, self.cached)
+
+BACKENDS = {}
+
+def register(name, cost, cached, samples = True):
+    '''
+    Decorator adding a fill function to the registry, see Backend
+    '''
+    def wrap(fill):
+        BACKENDS[name] = Backend(name, fill, cost, cached, samples)
+        return fill
+    return wrap
+
+def names():
+    '''
+    Returns the names of all registered backends
+    '''
+    return sorted(BACKENDS)
+
+def complete(name, depth, plan = None, samples = None, vec = None, timer = None):
+    '''
+    Fills a reduced depth frame with the backend of the given name.
+
+    Args:
+        name: Name of the backend, see names()
+
+        depth: Reduced depth matrix, NaN marks invalid pixels (e.g. the
+        output of Camera.reduceFrame)
+
+        plan: Optional FramePlan, required for the cached state of the
+        backends that reuse it
+
+        samples, vec: Samples of depth as given by createSamples (with the
+        same plan), drawn here when not given. Ignored by backends that
+        use the whole frame.
+
+        timer: Optional LatencyTracker (see latency.py), the duration of
+        the call is recorded on it as stage name
+
+    Returns:
+        matrix: Filled depth matrix. If the backend fails on the frame
+        (e.g. a singular RBF system), the frame is returned unfilled.
+        ValueError, TypeError and IndexError, which point at bad arguments,
+        are raised.
+
+        matrix: Confidence of every pixel between 0 and 1, 1 for measured
+        pixels
+    '''
+    if name not in BACKENDS:
+        raise ValueError('unknown depth completion backend: {0}'.format(name))
+    backend = BACKENDS[name]
+
+    t1 = time.time()
+    if backend.samples and samples is None:
+        perc_samples = 0.01 if plan is None else plan.perc_samples
+        samples, vec = createSamples(depth, perc_samples, plan = plan)
+    elif not backend.samples:
+        samples, vec = None, None
+
+    try:
+        if backend.samples and len(samples) == 0:
+            # no valid pixel to sample, the frame stays as it is
+            filled, confidence = depth, (~np.isnan(depth)).astype(np.float64)
+        else:
+            filled, confidence = backend.fill(depth, samples, vec, plan)
+    except np.linalg.LinAlgError as error:
+        filled, confidence = _unfilled(backend, depth, error)
+    except (ValueError, TypeError, IndexError):
+        raise
+    except Exception as error:
+        filled, confidence = _unfilled(backend, depth, error)
+
+    if timer is not None:
+        timer.record(name, time.time() - t1)
+    return filled, confidence
+
+def _unfilled(backend, depth, error):
+    """
+    Logs a failed backend and returns the frame as it is
+    """
+    logging.warning('backends.py: {0} failed: {1}'.format(backend.name, error))
+    backend.failures += 1
+    return depth, (~np.isnan(depth)).astype(np.float64)
+
+def _confidence(shape, distances, K):
+    """
+    Confidence from the distance to the nearest sample, 1 at the samples
+    and 0.5 one mean sample spacing away
+    """
+    spacing = np.sqrt(float(shape[0] * shape[1]) / max(1, K))
+    return 1.0 / (1.0 + (distances / spacing) ** 2)
+
+def _sampleConfidence(shape, samples, plan):
+    """
+    Confidence of the sample based backends, cached per sample set
+    """
+    def build():
+        if len(samples) == 0:
+            return np.zeros(shape)
+        mask = np.ones(shape, dtype = bool)
+        mask.ravel()[samples] = False
+        return _confidence(shape, distance_transform_edt(mask), len(samples))
+
+    if plan is None:
+        return build()
+    return plan.operator('confidence', shape, samples, build)
+
+@register('voronoi', cost = 'high', cached = False)
+def _voronoi(depth, samples, vec, plan):
+    filled = getVoronoi(depth.shape, samples, vec, plan = plan)
+    return filled, _sampleConfidence(depth.shape, samples, plan)
+
+@register('nearest', cost = 'low', cached = False)
+def _nearest(depth, samples, vec, plan):
+    filled, distances = getVoronoiRaster(depth.shape, samples, vec, distances = True)
+    return filled, _confidence(depth.shape, distances, len(samples))
+
+@register('nearest_cached', cost = 'low', cached = True)
+def _nearestCached(depth, samples, vec, plan):
+    if plan is None:
+        return _nearest(depth, samples, vec, plan)
+    filled = getVoronoiMapped(depth.shape, samples, vec, plan)
+    return filled, _sampleConfidence(depth.shape, samples, plan)
+
+@register('natural_neighbor', cost = 'medium', cached = True)
+def _naturalNeighbor(depth, samples, vec, plan):
+    filled = natural_neighbor.interpolate(depth.shape, samples, vec, plan = plan)
+    return filled, _sampleConfidence(depth.shape, samples, plan)
+
+@register('linear', cost = 'low', cached = True)
+def _linear(depth, samples, vec, plan):
+    filled = linear_interpolation.interpolate(depth.shape, samples, vec, plan = plan)
+    return filled, _sampleConfidence(depth.shape, samples, plan)
+
+@register('rbf', cost = 'high', cached = True)
+def _rbf(depth, samples, vec, plan):
+    filled = rbf_interpolation.interpolate(depth.shape, samples, vec, ftype = 'linear', plan = plan)
+    return filled, _sampleConfidence(depth.shape, samples, plan)
+
+@register('local_rbf', cost = 'medium', cached = True)
+def _localRbf(depth, samples, vec, plan):
+    filled = rbf_interpolation.interpolateLocal(depth.shape, samples, vec, ftype = 'linear', plan = plan)
+    return filled, _sampleConfidence(depth.shape, samples, plan)
+
+@register('push_pull', cost = 'low', cached = False, samples = False)
+def _pushPull(depth, samples, vec, plan):
+    return pushPull(depth, confidence = True)
+
+@register('discretize', cost = 'low', cached = False, samples = False)
+def _discretize(depth, samples, vec, plan):
+    iters = 2 if plan is None else plan.iters
+    return depthCompletion(depth, iters), (~np.isnan(depth)).astype(np.float64)
+
+def main():
+    '''
+    Runs every backend on a sample frame and prints their latencies
+    '''
+    from frame_plan import FramePlan
+
+    h = 144
+    w = 192
+
+    np.random.seed(54)
+    Z, Y = np.mgrid[0:h, 0:w]
+    depth = 2.0 + 0.01 * Y + 0.005 * Z
+    depth[np.random.rand(h, w) < 0.6] = np.nan
+
+    plan = FramePlan(perc_samples = 0.01)
+    for name in names():
+        t1 = time.time()
+        for _ in range(5):
+            filled, confidence = complete(name, depth, plan)
+        t2 = time.time()
+        print('{0}: {1:.1f} ms per frame, {2} NaN pixels, mean confidence {3:.2f}'.format(\
+            BACKENDS[name], (t2 - t1) / 5 * 1000, np.isnan(filled).sum(), confidence.mean()))
+
+if __name__== "__main__":
+    main()
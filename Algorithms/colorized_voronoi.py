@@ -9,7 +9,7 @@ from scipy.spatial import Voronoi
 def voronoi_finite_polygons_2d(vor, radius=None):
     """
     Reconstruct infinite voronoi regions in a 2D diagram to finite
-    regions.
+    regions. All regions are built at once with array operations.
 
     Parameters
     ----------
@@ -20,9 +20,15 @@ def voronoi_finite_polygons_2d(vor, radius=None):
 
     Returns
     -------
-    regions : list of tuples
-        Indices of vertices in each revised Voronoi regions.
-    vertices : list of tuples
+    region_vertices : ndarray
+        Indices of vertices of all revised Voronoi regions, concatenated
+        in the order of the input points. Each region is sorted
+        counterclockwise around its centroid, including finite regions,
+        whose Qhull order may be clockwise; the polygons are the same
+        either way.
+    offsets : ndarray
+        Region of point i is region_vertices[offsets[i]:offsets[i + 1]].
+    vertices : ndarray
         Coordinates for revised Voronoi vertices. Same as coordinates
         of input vertices, with 'points at infinity' appended to the
         end.
@@ -32,62 +38,54 @@ def voronoi_finite_polygons_2d(vor, radius=None):
     if vor.points.shape[1] != 2:
         raise ValueError("Requires 2D input")
 
-    new_regions = []
-    new_vertices = vor.vertices.tolist()
+    points = vor.points
+    n_points = len(points)
+    n_vertices = len(vor.vertices)
 
-    center = vor.points.mean(axis=0)
+    center = points.mean(axis=0)
     if radius is None:
-        radius = vor.points.ptp().max()*2
-
-    # Construct a map containing all ridges for a given point
-    all_ridges = {}
-    for (p1, p2), (v1, v2) in zip(vor.ridge_points, vor.ridge_vertices):
-        all_ridges.setdefault(p1, []).append((p2, v1, v2))
-        all_ridges.setdefault(p2, []).append((p1, v1, v2))
-
-    # Reconstruct infinite regions
-    for p1, region in enumerate(vor.point_region):
-        vertices = vor.regions[region]
-
-        if all(v >= 0 for v in vertices):
-            # finite region
-            new_regions.append(vertices)
-            continue
-
-        # reconstruct a non-finite region
-        ridges = all_ridges[p1]
-        new_region = [v for v in vertices if v >= 0]
-
-        for p2, v1, v2 in ridges:
-            if v2 < 0:
-                v1, v2 = v2, v1
-            if v1 >= 0:
-                # finite ridge: already in the region
-                continue
-
-            # Compute the missing endpoint of an infinite ridge
-
-            t = vor.points[p2] - vor.points[p1] # tangent
-            t /= np.linalg.norm(t)
-            n = np.array([-t[1], t[0]])  # normal
-
-            midpoint = vor.points[[p1, p2]].mean(axis=0)
-            direction = np.sign(np.dot(midpoint - center, n)) * n
-            far_point = vor.vertices[v2] + direction * radius
-
-            new_region.append(len(new_vertices))
-            new_vertices.append(far_point.tolist())
-
-        # sort region counterclockwise
-        vs = np.asarray([new_vertices[v] for v in new_region])
-        c = vs.mean(axis=0)
-        angles = np.arctan2(vs[:,1] - c[1], vs[:,0] - c[0])
-        new_region = np.array(new_region)[np.argsort(angles)]
-
-        # finish
-        new_regions.append(new_region.tolist())
-
-    return new_regions, np.asarray(new_vertices)
+        radius = np.ptp(points).max()*2
+
+    ridge_points = np.asarray(vor.ridge_points)
+    ridge_vertices = np.asarray(vor.ridge_vertices)
+
+    # infinite ridges: (-1, v) -> far point beyond the finite vertex v
+    infinite = np.flatnonzero((ridge_vertices < 0).any(axis=1))
+    p1, p2 = ridge_points[infinite].T
+    finite_end = ridge_vertices[infinite].max(axis=1)
+
+    t = points[p2] - points[p1] # tangent
+    t /= np.linalg.norm(t, axis=1)[:, None]
+    n = np.column_stack((-t[:, 1], t[:, 0])) # normal
+
+    midpoint = (points[p1] + points[p2]) / 2.0
+    direction = np.sign(((midpoint - center) * n).sum(axis=1))[:, None] * n
+    far_points = vor.vertices[finite_end] + direction * radius
+
+    # (point, vertex) pairs of both points of every ridge, with the far
+    # point standing in for the missing vertex of an infinite ridge
+    ridge_ends = ridge_vertices.copy()
+    far = n_vertices + np.arange(len(infinite))
+    ridge_ends[infinite] = np.column_stack((finite_end, far))
+    owner = np.repeat(ridge_points, 2, axis=1).ravel()
+    vertex = np.tile(ridge_ends, 2).ravel()
+
+    # every vertex is shared by two ridges of a point
+    n_total = n_vertices + len(infinite)
+    keys = np.unique(owner.astype(np.int64) * n_total + vertex)
+    owner, vertex = np.divmod(keys, n_total)
+
+    # sort regions counterclockwise around their centroid
+    vertices = np.vstack((vor.vertices, far_points))
+    counts = np.bincount(owner, minlength=n_points)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cx = np.bincount(owner, vertices[vertex, 0], n_points) / counts
+        cy = np.bincount(owner, vertices[vertex, 1], n_points) / counts
+    angles = np.arctan2(vertices[vertex, 1] - cy[owner], vertices[vertex, 0] - cx[owner])
+    order = np.lexsort((angles, owner))
+
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    return vertex[order], offsets, vertices
 
 def main():
     # make up data points
@@ -98,15 +96,11 @@ def main():
     vor = Voronoi(points)
 
     # plot
-    regions, vertices = voronoi_finite_polygons_2d(vor)
-    # print "--"
-    # print regions
-    # print "--"
-    # print vertices
+    regions, offsets, vertices = voronoi_finite_polygons_2d(vor)
 
     # colorize
-    for region in regions:
-        polygon = vertices[region]
+    for i in range(len(offsets) - 1):
+        polygon = vertices[regions[offsets[i]:offsets[i + 1]]]
         plt.fill(*zip(*polygon), alpha=0.7)
 
     plt.plot(points[:,0], points[:,1], 'ko')
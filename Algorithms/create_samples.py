@@ -5,27 +5,205 @@ Description: Module used to sample from depth matrices.
 
 import time
 import numpy as np
-from scipy import sparse
 
-def createSamples(depth, perc_samples):
+def randomIndices(N, K):
+    '''
+    Draws K distinct indices out of range(N) without permuting all N.
+
+    Args:
+        N: Number of indices to draw from
+
+        K: Number of indices to draw
+
+    Returns:
+        array: K distinct int32 indices, sorted
+    '''
+    if 2 * K > N:
+        # dense sampling, a permutation is as cheap as anything else
+        rand = np.random.permutation(N)[:K]
+        rand.sort()
+        return rand.astype(np.int32)
+
+    # draw with replacement until there are enough distinct indices
+    rand = np.unique(np.random.randint(0, N, size = K + K // 4 + 16))
+    while len(rand) < K:
+        more = np.random.randint(0, N, size = K - len(rand) + 16)
+        rand = np.union1d(rand, more)
+    if len(rand) > K:
+        rand = rand[np.sort(np.random.permutation(len(rand))[:K])]
+    return rand.astype(np.int32)
+
+def gridIndices(shape, K):
+    '''
+    Stratified grid sampling: splits the matrix into at least K equally
+    sized cells and draws one pixel at random from each, dropping the
+    surplus cells at random.
+
+    Args:
+        shape: Shape of the matrix
+
+        K: Number of samples wanted
+
+    Returns:
+        array: Sorted int32 flattened indices, K of them (fewer only if K
+        exceeds the number of pixels)
+    '''
+    h, w = shape
+    if K < 1:
+        return np.zeros(0, dtype = np.int32)
+
+    # cells as close to square as the matrix allows
+    rows = max(1, min(h, int(round(np.sqrt(K * h / float(w))))))
+    cols = max(1, min(w, int(np.ceil(K / float(rows)))))
+
+    r_edges = np.linspace(0, h, rows + 1).astype(np.int64)
+    c_edges = np.linspace(0, w, cols + 1).astype(np.int64)
+    r_size = np.diff(r_edges)
+    c_size = np.diff(c_edges)
+
+    r = r_edges[:-1, None] + (np.random.rand(rows, cols) * r_size[:, None]).astype(np.int64)
+    c = c_edges[None, :-1] + (np.random.rand(rows, cols) * c_size[None, :]).astype(np.int64)
+
+    indices = (r * w + c).ravel()
+    if len(indices) > K:
+        indices = indices[np.random.permutation(len(indices))[:K]]
+    return np.sort(indices).astype(np.int32)
+
+def poissonIndices(shape, K, tries = 30):
+    '''
+    Poisson-disk sampling (Bridson's algorithm): samples are spread at
+    random but no two are closer than a radius chosen to give about K
+    samples.
+
+    Args:
+        shape: Shape of the matrix
+
+        K: Number of samples wanted
+
+        tries: Candidates tried around each sample before it is retired
+
+    Returns:
+        array: Sorted int32 flattened indices (at most K of them)
+    '''
+    h, w = shape
+    if K < 1:
+        return np.zeros(0, dtype = np.int32)
+
+    # Bridson's algorithm places about 0.64 / r^2 samples per pixel, aim a
+    # little higher and drop the surplus
+    radius = max(1.0, np.sqrt(0.62 * h * w / float(K)))
+    cell = radius / np.sqrt(2)
+    gh = int(np.ceil(h / cell))
+    gw = int(np.ceil(w / cell))
+    # each grid cell holds at most one sample, -1 if empty
+    grid = -np.ones((gh, gw), dtype = np.int64)
+    # candidates lie within 2 radius of their sample, their neighbors
+    # within 3 radius, i.e. this many cells away
+    reach = int(np.ceil(3 * radius / cell))
+
+    points = np.zeros((gh * gw, 2))
+    points[0] = (np.random.rand() * h, np.random.rand() * w)
+    grid[int(points[0, 0] / cell), int(points[0, 1] / cell)] = 0
+    n = 1
+    active = [0]
+
+    while active:
+        k = np.random.randint(len(active))
+        y0, x0 = points[active[k]]
+
+        # candidates in the annulus [radius, 2 * radius) around the sample
+        rho = radius * (1 + np.random.rand(tries))
+        theta = 2 * np.pi * np.random.rand(tries)
+        cand = np.column_stack((y0 + rho * np.sin(theta), x0 + rho * np.cos(theta)))
+        cand = cand[(cand[:, 0] >= 0) & (cand[:, 0] < h) \
+            & (cand[:, 1] >= 0) & (cand[:, 1] < w)]
+
+        gy, gx = int(y0 / cell), int(x0 / cell)
+        near = grid[max(0, gy - reach):gy + reach + 1, max(0, gx - reach):gx + reach + 1]
+        others = points[near[near >= 0]]
+        d2 = ((cand[:, None, :] - others[None, :, :]) ** 2).sum(axis = 2)
+        ok = np.flatnonzero(d2.min(axis = 1) >= radius ** 2)
+
+        if len(ok) == 0:
+            active[k] = active[-1]
+            active.pop()
+            continue
+
+        y, x = cand[ok[0]]
+        points[n] = (y, x)
+        grid[int(y / cell), int(x / cell)] = n
+        active.append(n)
+        n += 1
+
+    points = points[:n].astype(np.int64)
+    indices = np.unique(points[:, 0] * w + points[:, 1])
+    if len(indices) > K:
+        indices = indices[np.sort(np.random.permutation(len(indices))[:K])]
+    return indices.astype(np.int32)
+
+# sampling patterns that only depend on the matrix shape, see samplePattern()
+_patterns = {}
+
+def samplePattern(shape, K, strategy = 'grid', redraw = False):
+    '''
+    Returns the sampling pattern of a shape-only strategy, computed once
+    per (strategy, shape, K) and cached.
+
+    Args:
+        shape: Shape of the matrix
+
+        K: Number of samples wanted
+
+        strategy: 'grid' (see gridIndices), 'poisson' (see
+        poissonIndices) or 'random' (see randomIndices)
+
+        redraw: Replace the cached pattern with a new draw
+
+    Returns:
+        array: Sorted int32 flattened indices
+    '''
+    key = (strategy, tuple(shape), K)
+    if redraw or key not in _patterns:
+        if strategy == 'grid':
+            _patterns[key] = gridIndices(shape, K)
+        elif strategy == 'poisson':
+            _patterns[key] = poissonIndices(shape, K)
+        elif strategy == 'random':
+            _patterns[key] = randomIndices(shape[0] * shape[1], K)
+        else:
+            raise ValueError('no fixed pattern for strategy: {0}'.format(strategy))
+    return _patterns[key]
+
+def createSamples(depth, perc_samples, plan = None, strategy = 'random'):
     '''
     Grabs samples from original data.
-    Sparse identity matrices are used to conserve memory since identity
-    matrices are mostly zeros.
 
     Args:
         depth: Depth matrix to grab samples from
 
         perc_samples: Percent sampling rate
 
+        plan: Optional FramePlan, samples are then drawn from its fixed
+        pattern for this shape (perc_samples and the strategy are taken
+        from the plan) instead of a new draw
+
+        strategy: How sample locations are chosen:
+            'random': uniformly at random, redrawn every frame
+            'grid': one random pixel per cell of a stratified grid
+            'poisson': Poisson-disk pattern, evenly spread at random
+            'valid': uniformly at random among the non-NaN pixels only,
+            so exactly min(K, # of non-NaN pixels) samples are returned
+        The 'grid' and 'poisson' patterns only depend on the shape and are
+        cached. Every strategy but 'valid' drops samples landing on NaN.
+
     Returns:
-        list: A list (of size less than or =
+        array: int32 array (of size less than or =
         perc_samples * # of cells in depth matrix)
         of flattened indices that correspond to non-NaN
         values in the given depth matrix
 
-        list: The actual depth values at the indices
-        given by the previous list
+        array: float32 array of the actual depth values at the
+        indices given by the previous array
     '''
     '''
     Code adapted from sparse-depth-sensing/lib/sampling/createSamples.m
@@ -39,31 +217,26 @@ def createSamples(depth, perc_samples):
     N = height * width
     K = int(N * perc_samples)
 
-    xGT = depth.flatten()
-    # random sampling
-    rand = np.random.permutation(N)[:K]
-    # xGT[rand] permutes the xGT matrix according to the rand matrix, creates
-    # a permuted matrix of size len(rand)
-    a = np.isnan(xGT[rand])
-    # rand[np.nonzero(~a)[0]] permutes the rand matrix according to the
-    # nonzero(~a) matrix, creates a permuted matrix of size len(nonzero(~a))
-    samples = rand[np.nonzero(~a)[0]]
+    # a view unless depth is not contiguous
+    xGT = depth.ravel()
+    if plan is not None:
+        rand = plan.pattern(depth.shape)
+    elif strategy == 'random':
+        # random sampling
+        rand = randomIndices(N, K)
+    elif strategy == 'valid':
+        nonNan = np.flatnonzero(~np.isnan(xGT))
+        if len(nonNan) > K:
+            nonNan = nonNan[randomIndices(len(nonNan), K)]
+        rand = nonNan.astype(np.int32)
+    else:
+        rand = samplePattern(depth.shape, K, strategy)
 
-    '''
-    very slow way of getting depth values at indices in samples
-    '''
-    # Rfull = sparse.eye(N)
-    # # for i in samples, takes the ith row from Rfull
-    # R = Rfull.tocsr()[samples,:]
-    # # scipy sparse matrix vector product, xGT is size n x 1
-    # vec = R*xGT
-
-    '''
-    faster way of getting depth values at indices in samples
-    '''
-    vec = []
-    for i in samples:
-        vec.append(xGT[i])
+    # gather the sampled values, then drop the ones that are NaN
+    values = xGT[rand]
+    valid = ~np.isnan(values)
+    samples = rand[valid].astype(np.int32)
+    vec = values[valid].astype(np.float32)
 
     return samples, vec
 
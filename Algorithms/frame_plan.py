@@ -0,0 +1,138 @@
+'''
+Description: Precomputed per-shape state shared by the depth pipeline
+(Camera.reduceFrame, createSamples, getVoronoi and interpolate), so that
+work depending only on frame shape and settings is done once.
+'''
+
+import numpy as np
+from create_samples import samplePattern
+
+class FramePlan:
+    """
+    Settings of the depth pipeline plus everything derived from them
+    """
+    def __init__(self, height_ratio = 0.5, sub_sample = 0.3, reduce_to = 'lower', \
+        perc_samples = 0.01, iters = 2, sampling = 'random'):
+        """
+        Initializes FramePlan object. Derived state is built on first use
+        and cached per frame shape.
+
+        Args:
+            height_ratio: Fraction of rows reduceFrame keeps
+            sub_sample: Scaling factor of reduceFrame
+            reduce_to: Band of rows reduceFrame keeps
+            perc_samples: Percent sampling rate of createSamples
+            iters: Subdivisions used by depthCompletion
+            sampling: Strategy of the fixed sampling pattern, 'random',
+            'grid' or 'poisson' (see create_samples.createSamples)
+        """
+        self.height_ratio = height_ratio
+        self.sub_sample = sub_sample
+        self.reduce_to = reduce_to
+        self.perc_samples = perc_samples
+        self.iters = iters
+        self.sampling = sampling
+
+        # filled in by Camera.reduceFrame
+        self.crop = None
+        self.crop_out = None
+
+        self._grids = {}
+        self._drawn = set()
+        self._redraw = set()
+        self._buffers = {}
+        self._cache = {}
+
+    def grid(self, shape):
+        '''
+        Returns the flattened column (Y) and row (Z) coordinates of every
+        pixel of a matrix, as np.meshgrid would give them.
+
+        Args:
+            shape: Shape of the matrix
+        '''
+        shape = tuple(shape)
+        if shape not in self._grids:
+            Yq, Zq = np.meshgrid(np.arange(0, shape[1]), np.arange(0, shape[0]))
+            self._grids[shape] = (Yq.ravel(), Zq.ravel())
+        return self._grids[shape]
+
+    def pattern(self, shape):
+        '''
+        Returns the flattened indices createSamples samples from
+        (perc_samples of all pixels, sorted, placed according to the plan's
+        sampling strategy). The pattern is drawn once per shape and kept
+        by create_samples.samplePattern until the next reshuffle().
+
+        Args:
+            shape: Shape of the matrix
+        '''
+        shape = tuple(shape)
+        K = int(shape[0] * shape[1] * self.perc_samples)
+        redraw = shape in self._redraw
+        self._redraw.discard(shape)
+        self._drawn.add(shape)
+        return samplePattern(shape, K, self.sampling, redraw = redraw)
+
+    def reshuffle(self):
+        '''
+        Draws new sampling patterns on next use (and forgets everything
+        cached for the old ones)
+        '''
+        self._redraw = set(self._drawn)
+        self._cache = {}
+
+    def buffer(self, name, shape, dtype = np.float64):
+        '''
+        Returns a reusable output buffer, allocated on first use.
+
+        Args:
+            name: Name of the buffer, one per pipeline stage
+            shape: Shape of the buffer
+            dtype: Data type of the buffer
+        '''
+        key = (name, tuple(shape), np.dtype(dtype))
+        if key not in self._buffers:
+            self._buffers[key] = np.empty(shape, dtype = dtype)
+        return self._buffers[key]
+
+    def cached(self, key, build):
+        '''
+        Returns a cached object (e.g. an interpolation operator for the
+        plan's fixed sampling pattern), building it on first use.
+
+        Args:
+            key: Hashable key of the object, should include the shape
+            build: Function without arguments that builds the object
+        '''
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    def operator(self, name, shape, samples, build, after = 1):
+        '''
+        Returns the interpolation operator of a stage for one sample set.
+        One operator is kept per stage and shape and it is rebuilt only
+        when the samples change (e.g. when other pattern locations came out
+        NaN than in the previous frame).
+
+        Args:
+            name: Name of the stage
+            shape: Shape of the matrix
+            samples: Flattened indices the operator was built for
+            build: Function without arguments that builds the operator
+            after: Number of frames in a row the samples have to repeat
+            before the operator is built, for operators costing more than
+            interpolating a few frames directly. None is returned until
+            then.
+        '''
+        key = ('operator', name, tuple(shape))
+        cached = self._cache.get(key)
+        if cached is None or not np.array_equal(cached[0], samples):
+            cached = (np.array(samples), None, 0)
+        seen = cached[2] + 1
+        op = cached[1]
+        if op is None and seen >= after:
+            op = build()
+        self._cache[key] = (cached[0], op, seen)
+        return op
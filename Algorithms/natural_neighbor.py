@@ -0,0 +1,265 @@
+'''
+Description: Module used to interpolate values of depth matrix using
+natural neighbor (Sibson) interpolation. Unlike getVoronoi, which copies
+the value of the nearest sample, the result is continuous across Voronoi
+region borders and reproduces planes exactly.
+
+The weights of every pixel are computed at once from the Delaunay
+triangulation of the samples (Watson's circumcircle formulation) and
+stored as a sparse matrix, so repeated sample sets cost one product.
+'''
+
+import numpy as np
+import time
+import matplotlib.pyplot as plt
+from scipy.spatial import Delaunay, cKDTree
+from scipy.sparse import csr_matrix
+from linear_interpolation import QhullError
+
+# query points are moved off the integer grid so that they never lie
+# exactly on a triangle edge or circumcircle of the integer samples
+_OFFSET = np.array([1e-4, 1.7e-4])
+
+def circumcenters(a, b, c):
+    '''
+    Circumcenters of the triangles (a, b, c), arrays of (n, 2) points
+    '''
+    b = b - a
+    c = c - a
+    d = 2.0 * (b[:, 0] * c[:, 1] - b[:, 1] * c[:, 0])
+    bb = (b ** 2).sum(axis = 1)
+    cc = (c ** 2).sum(axis = 1)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        ux = (c[:, 1] * bb - b[:, 1] * cc) / d
+        uy = (b[:, 0] * cc - c[:, 0] * bb) / d
+    return a + np.column_stack((ux, uy))
+
+def _area(a, b, c):
+    '''
+    Signed areas of the triangles (a, b, c)
+    '''
+    return 0.5 * ((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) \
+        - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0]))
+
+def _expand(starts, counts):
+    '''
+    Flattens the ranges [starts, starts + counts), returning the index of
+    the range every value came from and the values
+    '''
+    owner = np.repeat(np.arange(len(counts)), counts)
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, starts[owner] + np.arange(counts.sum()) - first
+
+def _circlePixels(shape, centers, radii):
+    '''
+    Enumerates the pixels inside the circles, row by row along the chords
+
+    Returns:
+        array: Index of the circle of every (circle, pixel) pair
+
+        array: Flattened index of the pixel of every pair
+    '''
+    h, w = shape
+    # slightly larger circles, the exact test is done on the query points
+    radii = radii + 1e-3
+
+    top = np.clip(np.ceil(centers[:, 1] - radii), 0, h).astype(np.int64)
+    bottom = np.clip(np.floor(centers[:, 1] + radii) + 1, 0, h).astype(np.int64)
+    circle, row = _expand(top, np.maximum(bottom - top, 0))
+
+    half = np.sqrt(np.maximum(radii[circle] ** 2 - (row - centers[circle, 1]) ** 2, 0))
+    left = np.clip(np.ceil(centers[circle, 0] - half), 0, w).astype(np.int64)
+    right = np.clip(np.floor(centers[circle, 0] + half) + 1, 0, w).astype(np.int64)
+    chord, col = _expand(left, np.maximum(right - left, 0))
+
+    return circle[chord], row[chord] * w + col
+
+class NaturalNeighbor:
+    """
+    Sibson interpolation weights of every pixel for one sample set
+    """
+    def __init__(self, shape, samples):
+        '''
+        Builds the (pixels x samples) weight matrix. Pixels outside the
+        convex hull of the samples take the value of the nearest sample, as
+        do all pixels when the samples cannot be triangulated (fewer than
+        3 or all collinear). Without samples every pixel is NaN.
+
+        Args:
+            shape: Shape of the depth matrix
+
+            samples: List of flattened indices of the samples
+        '''
+        h, w = shape
+        self.shape = tuple(shape)
+        self.samples = np.asarray(samples)
+
+        K = len(self.samples)
+        N = h * w
+        rows, cols = np.divmod(self.samples, w)
+        points = np.column_stack((cols, rows)).astype(np.float64)
+
+        pixel = np.arange(N)
+        query = np.column_stack((pixel % w, pixel // w)) + _OFFSET
+
+        if K == 0:
+            self.weights = csr_matrix((N, 0))
+            return
+
+        tri = None
+        if K >= 3:
+            try:
+                tri = Delaunay(points)
+            except QhullError:
+                # collinear samples span no triangle
+                tri = None
+        if tri is None:
+            _, nearest = cKDTree(points).query(query)
+            self.weights = csr_matrix((np.ones(N), (pixel, nearest)), shape = (N, K))
+            return
+
+        simplices = tri.simplices
+        a, b, c = points[simplices[:, 0]], points[simplices[:, 1]], points[simplices[:, 2]]
+        centers = circumcenters(a, b, c)
+        radii = np.sqrt(((a - centers) ** 2).sum(axis = 1))
+
+        # (pixel, triangle) pairs with the pixel inside the circumcircle
+        inside = tri.find_simplex(query) >= 0
+        inside[self.samples] = False
+        t, q = _circlePixels(shape, centers, radii)
+        keep = inside[q]
+        t, q = t[keep], q[keep]
+        keep = ((query[q] - centers[t]) ** 2).sum(axis = 1) < radii[t] ** 2
+        t, q = t[keep], q[keep]
+
+        # Watson: the area a pixel steals from vertex i is the sum over its
+        # triangles of the signed area between the old circumcenter and the
+        # circumcenters of the two new triangles through the pixel and i
+        x = query[q]
+        va, vb, vc = a[t], b[t], c[t]
+        C = centers[t]
+        ga = circumcenters(x, vb, vc)
+        gb = circumcenters(x, vc, va)
+        gc = circumcenters(x, va, vb)
+
+        stolen = np.concatenate((_area(C, gb, gc), _area(C, gc, ga), _area(C, ga, gb)))
+        owner = np.concatenate((q, q, q))
+        vertex = simplices[t].T.ravel()
+
+        weights = csr_matrix((stolen, (owner, vertex)), shape = (N, K))
+        total = np.asarray(weights.sum(axis = 1)).ravel()
+
+        # samples, pixels outside the hull and numerically degenerate pixels
+        # take the nearest sample
+        direct = ~inside | ~(np.abs(total) > 1e-12)
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            scale = np.where(direct, 0.0, 1.0 / total)
+        weights = csr_matrix(weights.multiply(scale[:, None]))
+
+        outside = np.flatnonzero(direct)
+        _, nearest = cKDTree(points).query(query[outside])
+        weights = weights + csr_matrix((np.ones(len(outside)), (outside, nearest)), \
+            shape = (N, K))
+        weights.eliminate_zeros()
+        self.weights = weights
+
+    def apply(self, vec):
+        '''
+        Interpolates the sample values, vec may also be a (samples x
+        frames) stack, which gives a (h, w, frames) stack
+        '''
+        if self.weights.shape[1] == 0:
+            return np.full(self.shape + np.shape(vec)[1:], np.nan)
+        filled = self.weights.dot(vec)
+        return filled.reshape(self.shape + np.shape(vec)[1:])
+
+def interpolate(shape, samples, vec, plan = None):
+    '''
+    Constructs new depth image by natural neighbor interpolation of the
+    known points.
+
+    Args:
+        shape: Shape of the depth matrix
+
+        samples: List of flattened indices of non-NaN values
+        in depth matrix
+
+        vec: List of depth values at the indices
+        given by the previous list
+
+        plan: Optional FramePlan, the weights are then cached and reused
+        for as long as the samples stay the same
+
+        * NOTE: samples and vec must be obtained from the function
+        create_samples.createSamples()
+
+    Returns:
+        matrix: New interpolated depth matrix
+    '''
+    if plan is not None:
+        nn = plan.operator('natural_neighbor', shape, samples, \
+            lambda: NaturalNeighbor(shape, samples))
+    else:
+        nn = NaturalNeighbor(shape, samples)
+    return nn.apply(vec)
+
+def main():
+    '''
+    Unit tests
+    '''
+    from create_samples import createSamples
+    from voronoi import getVoronoiRaster
+
+    h = 48
+    w = 64
+    perc_samples = 0.05
+
+    np.random.seed(54)
+    depth = np.zeros((h, w))
+    depth.fill(np.nan)
+    for _ in range(int((h * w) * 0.4)):
+        y, x = int(h * np.random.sample()), int(w * np.random.sample())
+        depth[y, x] = 6.0 * np.random.sample()
+
+    samples, vec = createSamples(depth, perc_samples)
+
+    t1 = time.time()
+    nn = NaturalNeighbor(depth.shape, samples)
+    t2 = time.time()
+    natural = nn.apply(vec)
+    t3 = time.time()
+    nearest = getVoronoiRaster(depth.shape, samples, vec)
+    print('Time to build weights: ' + str(t2 - t1))
+    print('Time to interpolate: ' + str(t3 - t2))
+
+    # natural neighbor interpolation reproduces planes inside the hull
+    Z, Y = np.divmod(np.arange(h * w), w)
+    plane = 0.02 * Y - 0.03 * Z + 2.0
+    inside = Delaunay(np.column_stack((Y[samples], Z[samples]))).find_simplex(\
+        np.column_stack((Y, Z)) + _OFFSET) >= 0
+    error = np.abs(nn.apply(plane[samples]).ravel() - plane)[inside].max()
+    print('Largest error on a plane: ' + str(error))
+
+    plt.figure()
+
+    y = 1.2
+    plt.subplot(1, 3, 1)
+    plt.title('Original', y=y)
+    plt.imshow(depth, cmap='plasma')
+    plt.colorbar(fraction = 0.046, pad = 0.04)
+
+    plt.subplot(1, 3, 2)
+    plt.title('Nearest Neighbor', y=y)
+    plt.imshow(nearest, cmap='plasma')
+    plt.colorbar(fraction = 0.046, pad = 0.04)
+
+    plt.subplot(1, 3, 3)
+    plt.title('Natural Neighbor', y=y)
+    plt.imshow(natural, cmap='plasma')
+    plt.colorbar(fraction = 0.046, pad = 0.04)
+
+    plt.subplots_adjust(wspace = 0.6)
+    plt.show()
+
+if __name__== "__main__":
+    main()
@@ -0,0 +1,139 @@
+'''
+Description: Fills in gaps in a depth matrix with a push-pull pyramid.
+Unlike the sample based interpolations (getVoronoi, interpolate), every
+valid pixel of the frame is used, in O(N) time.
+
+Pull: the frame is repeatedly halved, averaging the valid pixels of each
+2 x 2 block, until no holes are left. Push: going back up, every level is
+blended with the upsampled coarser level where it has too little data.
+'''
+
+import numpy as np
+import time
+import matplotlib.pyplot as plt
+
+def _halve(values, weights):
+    """
+    Sums 2 x 2 blocks of weighted values and of weights, odd sizes are
+    padded with empty pixels
+    """
+    h, w = weights.shape
+    ph, pw = h % 2, w % 2
+    if ph or pw:
+        values = np.pad(values, ((0, ph), (0, pw)), mode = 'constant')
+        weights = np.pad(weights, ((0, ph), (0, pw)), mode = 'constant')
+    h, w = weights.shape
+
+    total = (values * weights).reshape(h // 2, 2, w // 2, 2).sum(axis = (1, 3))
+    weight = weights.reshape(h // 2, 2, w // 2, 2).sum(axis = (1, 3))
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        mean = np.where(weight > 0, total / weight, 0)
+    return mean, weight
+
+def _axisWeights(n_fine, n_coarse):
+    """
+    Indices and weights of the two coarse pixels each fine pixel is
+    linearly interpolated from, along one axis
+    """
+    x = np.clip((np.arange(n_fine) + 0.5) / 2.0 - 0.5, 0, n_coarse - 1)
+    lo = np.floor(x).astype(np.int64)
+    hi = np.minimum(lo + 1, n_coarse - 1)
+    return lo, hi, x - lo
+
+def _upsample(coarse, shape):
+    """
+    Bilinearly doubles the coarse level to the shape of the finer level
+    """
+    r0, r1, fr = _axisWeights(shape[0], coarse.shape[0])
+    c0, c1, fc = _axisWeights(shape[1], coarse.shape[1])
+    rows = coarse[r0] * (1 - fr)[:, None] + coarse[r1] * fr[:, None]
+    return rows[:, c0] * (1 - fc) + rows[:, c1] * fc
+
+def pushPull(depth, confidence = False):
+    '''
+    Fills the NaN pixels of a depth matrix from all valid pixels.
+
+    Args:
+        depth: Depth matrix, NaN marks invalid pixels (e.g. the output of
+        Camera.reduceFrame)
+
+        confidence: Also return, for every pixel, the amount of measured
+        data its value is based on, 1 for valid pixels and decreasing
+        towards 0 with the size of the hole
+
+    Returns:
+        matrix: Filled depth matrix, valid pixels keep their value. All NaN
+        if depth has no valid pixel.
+
+        matrix: Confidence, only if requested
+    '''
+    valid = ~np.isnan(depth)
+    if not valid.any():
+        filled = np.full(depth.shape, np.nan)
+        return (filled, np.zeros(depth.shape)) if confidence else filled
+
+    # pull
+    values = [np.where(valid, depth, 0)]
+    weights = [valid.astype(np.float64)]
+    while (weights[-1] == 0).any():
+        mean, weight = _halve(values[-1], weights[-1])
+        values.append(mean)
+        # a coarse pixel with a full pixel of data is trusted completely
+        weights.append(np.minimum(weight, 1.0))
+
+    # push
+    filled = values[-1]
+    trust = weights[-1]
+    for level in range(len(values) - 2, -1, -1):
+        shape = values[level].shape
+        w = weights[level]
+        filled = w * values[level] + (1 - w) * _upsample(filled, shape)
+        if confidence:
+            trust = w + (1 - w) * 0.5 * _upsample(trust, shape)
+
+    if confidence:
+        return filled, trust
+    return filled
+
+def main():
+    '''
+    Unit tests
+    '''
+    h = 144
+    w = 192
+
+    np.random.seed(54)
+    Z, Y = np.mgrid[0:h, 0:w]
+    depth = 2.0 + 0.01 * Y + 0.005 * Z
+    depth[np.random.rand(h, w) < 0.7] = np.nan
+    depth[40:90, 60:130] = np.nan
+
+    t1 = time.time()
+    filled, trust = pushPull(depth, confidence = True)
+    t2 = time.time()
+    print('Time to fill: ' + str(t2 - t1))
+    print('Largest error on the plane: ' + str(np.abs(filled - (2.0 + 0.01 * Y + 0.005 * Z)).max()))
+
+    plt.figure()
+
+    y = 1.2
+    plt.subplot(1, 3, 1)
+    plt.title('Original', y=y)
+    plt.imshow(depth, cmap='plasma')
+    plt.colorbar(fraction = 0.046, pad = 0.04)
+
+    plt.subplot(1, 3, 2)
+    plt.title('Push-Pull', y=y)
+    plt.imshow(filled, cmap='plasma')
+    plt.colorbar(fraction = 0.046, pad = 0.04)
+
+    plt.subplot(1, 3, 3)
+    plt.title('Confidence', y=y)
+    plt.imshow(trust, cmap='plasma')
+    plt.colorbar(fraction = 0.046, pad = 0.04)
+
+    plt.subplots_adjust(wspace = 0.6)
+    plt.show()
+
+if __name__== "__main__":
+    main()
@@ -8,9 +8,25 @@ Original paper: https://github.com/sparse-depth-sensing/sparse-depth-sensing
 import numpy as np
 import time
 from scipy.interpolate import Rbf
+from scipy.spatial import cKDTree
+from scipy.special import xlogy
+from scipy.linalg import lu_factor, lu_solve
+from scipy.sparse import csr_matrix
 import matplotlib.pyplot as plt
 
-def interpolate(shape, samples, vec, ftype='linear'):
+# radial functions of scipy.interpolate.Rbf, r is the distance and eps the
+# shape parameter
+_KERNELS = {
+    'linear': lambda r, eps: r,
+    'cubic': lambda r, eps: r ** 3,
+    'quintic': lambda r, eps: r ** 5,
+    'thin_plate': lambda r, eps: xlogy(r ** 2, r),
+    'multiquadric': lambda r, eps: np.sqrt((r / eps) ** 2 + 1),
+    'inverse': lambda r, eps: 1.0 / np.sqrt((r / eps) ** 2 + 1),
+    'gaussian': lambda r, eps: np.exp(-(r / eps) ** 2),
+}
+
+def interpolate(shape, samples, vec, ftype='linear', plan=None):
     '''
     Constructs new depth image by interpolating known points. RBF
     is used to interpolate.
@@ -28,6 +44,11 @@ def interpolate(shape, samples, vec, ftype='linear'):
         found on the scipy.interpolate.Rbf docs - default is
         'linear'
 
+        plan: Optional FramePlan. Once the same samples come twice in a
+        row (e.g. a fixed pattern without moving holes), the interpolation
+        is done with an RbfOperator that is reused for as long as the
+        samples stay the same.
+
         * NOTE: samples and vec must be obtained from the function
         create_samples.createSamples()
 
@@ -38,18 +59,254 @@ def interpolate(shape, samples, vec, ftype='linear'):
     Code adapted from
     sparse-depth-sensing/lib/algorithm/linearInterpolationOnImage.m
     '''
+    if plan is not None:
+        # building the operator costs many direct interpolations, so only
+        # sample sets that repeat get one
+        op = plan.operator('rbf_' + ftype, shape, samples, \
+            lambda: RbfOperator(shape, samples, ftype=ftype, plan=plan), after = 2)
+        if op is not None:
+            return op.apply(vec)
+    if len(samples) == 0:
+        return np.full(shape, np.nan)
+
     h = np.arange(0, shape[0])
     w = np.arange(0, shape[1])
 
     Yq, Zq = np.meshgrid(w, h)
-    Y_sample = Yq.flatten()[samples]
-    Z_sample = Zq.flatten()[samples]
+    Y, Z = Yq.ravel(), Zq.ravel()
+    Y_sample = Y[samples]
+    Z_sample = Z[samples]
 
     rbfi = Rbf(Y_sample, Z_sample, vec, function=ftype)
-    interpolated = rbfi(Yq, Zq)
+    interpolated = rbfi(Y, Z).reshape(shape)
 
     return interpolated
 
+class LocalRbf:
+    """
+    RBF interpolation where every pixel only uses its k nearest samples
+    (radial function plus a constant). The cost grows linearly with the
+    number of pixels instead of with the cube of the number of samples.
+    """
+    def __init__(self, shape, samples, ftype='linear', k=16, chunk=16384, plan=None):
+        '''
+        Finds the neighbors of every pixel and computes their weights.
+        Neighboring pixels mostly share their k nearest samples, so each
+        distinct neighbor set is factorized once. The factorizations are
+        only kept while the weights of their pixels are computed.
+
+        Args:
+            shape: Shape of the depth matrix
+
+            samples: List of flattened indices of the samples
+
+            ftype: Interpolation type, one of the scipy.interpolate.Rbf
+            functions - default is 'linear'
+
+            k: Number of nearest samples used per pixel
+
+            chunk: Number of neighbor sets factorized at once, bounds the
+            memory used
+
+            plan: Optional FramePlan providing the pixel grid
+        '''
+        if ftype not in _KERNELS:
+            raise ValueError('unknown RBF function: {0}'.format(ftype))
+        kernel = _KERNELS[ftype]
+
+        if plan is not None:
+            Y, Z = plan.grid(shape)
+        else:
+            h = np.arange(0, shape[0])
+            w = np.arange(0, shape[1])
+
+            Yq, Zq = np.meshgrid(w, h)
+            Y, Z = Yq.ravel(), Zq.ravel()
+        points = np.column_stack((Y[samples], Z[samples])).astype(np.float64)
+        pixels = np.column_stack((Y, Z)).astype(np.float64)
+
+        self.shape = tuple(shape)
+        if len(points) == 0:
+            # nothing to interpolate from, apply() gives NaN
+            self.k = 0
+            self.neighbors = np.zeros((len(pixels), 0), dtype = np.int64)
+            self.weights = np.zeros((len(pixels), 0))
+            return
+
+        self.k = k = max(1, min(k, len(points)))
+        dist, neighbors = cKDTree(points).query(pixels, k = k)
+        order = np.argsort(neighbors.reshape(-1, k), axis = 1)
+        self.neighbors = neighbors = np.take_along_axis(neighbors.reshape(-1, k), order, axis = 1)
+        dist = np.take_along_axis(dist.reshape(-1, k), order, axis = 1)
+
+        # distinct neighbor sets, the rows of sorted indices
+        _, first, which = np.unique(neighbors, axis = 0, \
+            return_index = True, return_inverse = True)
+        which = which.ravel()
+        sets = neighbors[first]
+        # pixels grouped by their neighbor set
+        by_set = np.argsort(which, kind = 'stable')
+        bounds = np.searchsorted(which[by_set], np.arange(0, len(sets) + chunk, chunk))
+
+        # the weights of a pixel are the first k entries of
+        # inverse . [phi(pixel), 1], the system being symmetric
+        self.weights = np.empty((len(pixels), k))
+        for n, start in enumerate(range(0, len(sets), chunk)):
+            local = points[sets[start:start + chunk]]
+            # |a - b|^2 = |a|^2 + |b|^2 - 2 a.b, exact for pixel coordinates
+            sq = (local ** 2).sum(axis = 2)
+            r = np.sqrt(np.maximum(sq[:, :, None] + sq[:, None, :] \
+                - 2 * np.matmul(local, local.transpose(0, 2, 1)), 0))
+            e = r.sum(axis = (1, 2)) / max(1, k * (k - 1)) + 1e-9
+
+            # [[phi, 1], [1, 0]]
+            A = np.ones((len(local), k + 1, k + 1))
+            A[:, :k, :k] = kernel(r, e[:, None, None])
+            A[:, k, k] = 0
+            inverses = np.linalg.inv(A)
+
+            group = by_set[bounds[n]:bounds[n + 1]]
+            for i in range(0, len(group), chunk):
+                pix = group[i:i + chunk]
+                inv = inverses[which[pix] - start]
+                phi = kernel(dist[pix], e[which[pix] - start][:, None])
+                self.weights[pix] = np.einsum('nij,nj->ni', inv[:, :k, :k], phi) + inv[:, :k, k]
+
+    def apply(self, vec):
+        '''
+        Interpolates the sample values: every pixel is the weighted sum of
+        its neighbors
+        '''
+        if self.k == 0:
+            return np.full(self.shape, np.nan)
+        values = np.asarray(vec, dtype = np.float64)[self.neighbors]
+        return np.einsum('nk,nk->n', self.weights, values).reshape(self.shape)
+
+def interpolateLocal(shape, samples, vec, ftype='linear', k=16, plan=None):
+    '''
+    Constructs new depth image by interpolating known points with a local
+    RBF: every pixel uses only its k nearest samples (see LocalRbf).
+    Unlike interpolate, this stays usable at full resolution and at high
+    sampling rates.
+
+    Args:
+        shape: Shape of the depth matrix
+
+        samples: List of flattened indices of non-NaN values
+        in depth matrix
+
+        vec: List of depth values at the indices
+        given by the previous list
+
+        ftype: Interpolation type, one of the scipy.interpolate.Rbf
+        functions - default is 'linear'
+
+        k: Number of nearest samples used per pixel
+
+        plan: Optional FramePlan providing the pixel grid. Once the same
+        samples come twice in a row, the interpolation is done with an
+        RbfOperator that is reused for as long as the samples stay the
+        same.
+
+        * NOTE: samples and vec must be obtained from the function
+        create_samples.createSamples()
+
+    Returns:
+        matrix: New interpolated depth matrix
+    '''
+    if plan is not None:
+        op = plan.operator('local_rbf_{0}_{1}'.format(ftype, k), shape, samples, \
+            lambda: RbfOperator(shape, samples, ftype=ftype, local=True, k=k, plan=plan), \
+            after = 2)
+        if op is not None:
+            return op.apply(vec)
+    return LocalRbf(shape, samples, ftype=ftype, k=k, plan=plan).apply(vec)
+
+class RbfOperator:
+    """
+    Linear map from the sample values to the interpolated image for one
+    sample set. The kernel systems are factorized once, after that every
+    frame is one matrix-vector product and a stack of frames one
+    matrix-matrix product.
+    """
+    def __init__(self, shape, samples, ftype='linear', local=False, k=16, \
+        chunk=16384, plan=None):
+        '''
+        Builds the (pixels x samples) interpolation matrix.
+
+        Args:
+            shape: Shape of the depth matrix
+
+            samples: List of flattened indices of the samples
+
+            ftype: Interpolation type, one of the scipy.interpolate.Rbf
+            functions - default is 'linear'
+
+            local: Use the k nearest samples per pixel (see LocalRbf),
+            giving a sparse matrix. Otherwise the matrix is dense and
+            gives the same result as interpolate(), using pixels x samples
+            floats of memory.
+
+            k: Number of nearest samples used per pixel when local
+
+            chunk: Number of pixels evaluated at once, bounds the memory
+            used while building
+
+            plan: Optional FramePlan providing the pixel grid
+        '''
+        if ftype not in _KERNELS:
+            raise ValueError('unknown RBF function: {0}'.format(ftype))
+        self.shape = tuple(shape)
+        K = len(samples)
+        N = shape[0] * shape[1]
+
+        if K == 0:
+            # nothing to interpolate from, apply() gives NaN
+            self.matrix = np.zeros((N, 0))
+            return
+
+        if local:
+            rbf = LocalRbf(shape, samples, ftype=ftype, k=k, chunk=chunk, plan=plan)
+            rows = np.repeat(np.arange(N), rbf.k)
+            self.matrix = csr_matrix((rbf.weights.ravel(), \
+                (rows, rbf.neighbors.ravel())), shape = (N, K))
+            return
+
+        kernel = _KERNELS[ftype]
+        if plan is not None:
+            Y, Z = plan.grid(shape)
+        else:
+            Yq, Zq = np.meshgrid(np.arange(0, shape[1]), np.arange(0, shape[0]))
+            Y, Z = Yq.ravel(), Zq.ravel()
+        points = np.column_stack((Y[samples], Z[samples])).astype(np.float64)
+        pixels = np.column_stack((Y, Z)).astype(np.float64)
+
+        # default epsilon of scipy.interpolate.Rbf
+        edges = points.max(axis = 0) - points.min(axis = 0)
+        edges = edges[np.nonzero(edges)]
+        eps = np.power(np.prod(edges) / K, 1.0 / edges.size) if edges.size else 1.0
+
+        r = np.sqrt(((points[:, None, :] - points[None, :, :]) ** 2).sum(axis = 2))
+        lu = lu_factor(kernel(r, eps))
+
+        # the kernel matrix is symmetric, so phi(pixels) . A^-1 is the
+        # transpose of A^-1 . phi(pixels)^T
+        self.matrix = np.empty((N, K))
+        for start in range(0, N, chunk):
+            q = pixels[start:start + chunk]
+            r = np.sqrt(((q[:, None, :] - points[None, :, :]) ** 2).sum(axis = 2))
+            self.matrix[start:start + chunk] = lu_solve(lu, kernel(r, eps).T).T
+
+    def apply(self, vec):
+        '''
+        Interpolates the sample values, vec may also be a (samples x
+        frames) stack, which gives a (h, w, frames) stack
+        '''
+        if self.matrix.shape[1] == 0:
+            return np.full(self.shape + np.shape(vec)[1:], np.nan)
+        filled = self.matrix.dot(vec)
+        return np.asarray(filled).reshape(self.shape + np.shape(vec)[1:])
+
 def main():
     '''
     Unit tests
@@ -73,46 +330,54 @@ def main():
     samples, vec = createSamples(depth, perc_samples)
     linear = interpolate(depth.shape, samples, vec, ftype='linear')
     t2 = time.time()
+    local = interpolateLocal(depth.shape, samples, vec, ftype='linear', k=8)
+    t3 = time.time()
     thin_plate = interpolate(depth.shape, samples, vec, ftype='thin_plate')
     gaussian = interpolate(depth.shape, samples, vec, ftype='gaussian')
     multiquadric = interpolate(depth.shape, samples, vec, ftype='multiquadric')
     inv_multiquadric = interpolate(depth.shape, samples, vec, ftype='inverse')
     print('Time to create samples and interpolate: ' + str(t2 - t1))
+    print('Time to interpolate with local RBF: ' + str(t3 - t2))
 
     # figsize = (6, 2.5)
     plt.figure()
 
     y = 1.2
-    plt.subplot(2, 3, 1)
+    plt.subplot(2, 4, 1)
     plt.title('Original', y=y)
     plt.imshow(depth, cmap='plasma')
     plt.colorbar(fraction = 0.046, pad = 0.04)
     
-    plt.subplot(2, 3, 2)
+    plt.subplot(2, 4, 2)
     plt.title('Linear RBF', y=y)
     plt.imshow(linear, cmap='plasma')
     plt.colorbar(fraction = 0.046, pad = 0.04)
 
-    plt.subplot(2, 3, 3)
+    plt.subplot(2, 4, 3)
     plt.title('Thin Plate Spline RBF', y=y)
     plt.imshow(thin_plate, cmap='plasma')
     plt.colorbar(fraction = 0.046, pad = 0.04)
 
-    plt.subplot(2, 3, 4)
+    plt.subplot(2, 4, 4)
     plt.title('Gaussian RBF', y=y)
     plt.imshow(gaussian, cmap='plasma')
     plt.colorbar(fraction = 0.046, pad = 0.04)
     
-    plt.subplot(2, 3, 5)
+    plt.subplot(2, 4, 5)
     plt.title('Multiquadric RBF', y=y)
     plt.imshow(multiquadric, cmap='plasma')
     plt.colorbar(fraction = 0.046, pad = 0.04)
 
-    plt.subplot(2, 3, 6)
+    plt.subplot(2, 4, 6)
     plt.title('Inverse Multiquadric RBF', y=y)
     plt.imshow(inv_multiquadric, cmap='plasma')
     plt.colorbar(fraction = 0.046, pad = 0.04)
 
+    plt.subplot(2, 4, 7)
+    plt.title('Local Linear RBF', y=y)
+    plt.imshow(local, cmap='plasma')
+    plt.colorbar(fraction = 0.046, pad = 0.04)
+
     # plt.figure()
     # x = range(h*w)
     # flat = interpolated.copy()
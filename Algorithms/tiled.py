@@ -0,0 +1,354 @@
+'''
+Description: Runs any sample based interpolation (getVoronoi,
+getVoronoiRaster, interpolate, ... or a backend of backends.py by name)
+on overlapping tiles of the frame in parallel, so full resolution frames
+use all cores.
+
+Every tile is interpolated together with the samples its pixels depend
+on, which depend on the kind of backend (its support):
+- 'nearest': the nearest sample of every pixel of the tile
+- 'triangle': the vertices of the Delaunay triangles holding pixels of
+  the tile, which stay Delaunay triangles in any subset of the samples
+- 'circumcircle': the vertices of the Delaunay triangles whose
+  circumcircle holds pixels of the tile, the natural neighbors of those
+  pixels
+plus, for the last two, the nearest samples of the pixels outside the
+convex hull. Nearest and natural neighbor fills then match the whole
+frame and no seams show where the tiles are stitched. Delaunay linear
+matches too, except where four or more samples lie on one circle (common
+on the integer pixel grid): the triangulation is then not unique and a
+tile may split them along another diagonal than the whole frame.
+
+The tiles overlap, TiledExecutor.area reports the added work. Nearest
+fills add little. At low sampling rates, long thin triangles along the
+frame's border make the triangle based supports reach far across the
+frame (about 2x the frame's area for 2 x 2 tiles at 0.5% valid samples,
+1.2-1.4x at 2.5%).
+
+Other backends (e.g. RBF) depend on every sample and need a fixed halo,
+which only approximates them.
+'''
+
+import numpy as np
+import time
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from scipy.spatial import Delaunay, cKDTree
+from linear_interpolation import QhullError
+from natural_neighbor import circumcenters
+
+def _run(task):
+    """
+    Interpolates one tile, module level so that process pools can pickle
+    it
+    """
+    backend, shape, samples, vec = task
+    if len(samples) == 0:
+        return np.full(shape, np.nan)
+    if isinstance(backend, str):
+        # registry backend, only the shape of the frame is used
+        import backends
+        filled, _ = backends.BACKENDS[backend].fill(np.full(shape, np.nan), samples, vec, None)
+        return filled
+    return backend(shape, samples, vec)
+
+def _hullRows(points, hull, h):
+    """
+    Leftmost and rightmost column of the convex hull on every row, NaN on
+    rows the hull does not reach
+    """
+    a = points[hull[:, 0]]
+    b = points[hull[:, 1]]
+    y = np.arange(h, dtype = np.float64)[:, None]
+    lo = np.minimum(a[:, 1], b[:, 1])
+    hi = np.maximum(a[:, 1], b[:, 1])
+    crosses = (y >= lo) & (y <= hi)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        t = np.where(hi > lo, (y - a[:, 1]) / (b[:, 1] - a[:, 1]), 0.0)
+    x = a[:, 0] + t * (b[:, 0] - a[:, 0])
+    # horizontal edges cross their row at both ends
+    x_lo = np.where(crosses, np.minimum(x, np.where(hi > lo, x, b[:, 0])), np.inf).min(axis = 1)
+    x_hi = np.where(crosses, np.maximum(x, np.where(hi > lo, x, b[:, 0])), -np.inf).max(axis = 1)
+    missing = ~np.isfinite(x_lo)
+    x_lo[missing] = np.nan
+    x_hi[missing] = np.nan
+    return x_lo, x_hi
+
+# support of the sample based backends of backends.py, see the module
+# description
+_SUPPORT = {
+    'voronoi': 'nearest',
+    'nearest': 'nearest',
+    'nearest_cached': 'nearest',
+    'linear': 'triangle',
+    'natural_neighbor': 'circumcircle',
+}
+
+class TiledExecutor:
+    """
+    Pool of workers interpolating the tiles of a frame
+    """
+    def __init__(self, tiles = (2, 2), halo = None, workers = None, processes = False):
+        """
+        Initializes TiledExecutor object, call close() when done
+
+        Args:
+            tiles: Number of (rows, columns) of tiles
+            halo: By default every tile gets the samples its pixels depend
+            on (see the module description). A width in pixels instead adds
+            the samples of a fixed border around every tile, for backends
+            without a known support; it only approximates them.
+            workers: Number of workers, by default one per tile up to the
+            number of cores
+            processes: Use a process pool instead of threads, for backends
+            that hold the GIL. The backend then has to be picklable (a
+            module level function or a backend name).
+        """
+        self.tiles = tiles
+        self.halo = halo
+        # summed area of the tiles of the last frame over the frame's area,
+        # the work added by tiling
+        self.area = None
+        if workers is None:
+            workers = min(tiles[0] * tiles[1], multiprocessing.cpu_count())
+        self.pool = multiprocessing.Pool(workers) if processes else ThreadPool(workers)
+
+    def close(self):
+        """
+        Stops the workers
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def _bounds(self, n, parts):
+        """
+        Start and end of every tile along one axis
+        """
+        edges = np.linspace(0, n, parts + 1).astype(int)
+        return list(zip(edges[:-1], edges[1:]))
+
+    def _cores(self, shape):
+        """
+        Rows and columns (r0, r1, c0, c1) of the part of the frame every
+        tile fills
+        """
+        h, w = shape
+        return [(r0, r1, c0, c1) for r0, r1 in self._bounds(h, self.tiles[0]) \
+            for c0, c1 in self._bounds(w, self.tiles[1])]
+
+    def _extents(self, shape, samples, support):
+        """
+        Extent (r0, r1, c0, c1) of every tile holding all samples the
+        pixels of its core depend on, None if every pixel depends on every
+        sample (no samples, or samples that cannot be triangulated)
+        """
+        h, w = shape
+        rows, cols = np.divmod(np.asarray(samples), w)
+        points = np.column_stack((cols, rows)).astype(np.float64)
+        cores = self._cores(shape)
+        if len(points) == 0:
+            return None
+        tree = cKDTree(points)
+
+        if support == 'nearest':
+            # the nearest sample of a pixel in the core is also the nearest
+            # sample of a point on the core's border, so it is at most the
+            # largest nearest distance of the border pixels (plus half a
+            # pixel) away from the core
+            extents = []
+            for r0, r1, c0, c1 in cores:
+                Z, Y = np.mgrid[r0:r1, c0:c1]
+                border = np.ones(Z.shape, dtype = bool)
+                border[1:-1, 1:-1] = False
+                distance, _ = tree.query(np.column_stack((Y[border], Z[border])))
+                reach = int(np.ceil(distance.max() + 0.5))
+                extents.append((max(0, r0 - reach), min(h, r1 + reach), \
+                    max(0, c0 - reach), min(w, c1 + reach)))
+            return extents
+
+        if len(points) < 3:
+            return None
+        try:
+            tri = Delaunay(points)
+        except QhullError:
+            return None
+        a, b, c = (points[tri.simplices[:, i]] for i in range(3))
+
+        if support == 'triangle':
+            box = np.column_stack((np.minimum(np.minimum(a, b), c), \
+                np.maximum(np.maximum(a, b), c)))
+        else:
+            centers = circumcenters(a, b, c)
+            radii = np.sqrt(((a - centers) ** 2).sum(axis = 1))
+
+            # box around the part of every circumcircle inside the hull.
+            # When the center lies beyond a hull edge of the triangle, that
+            # part is the thin segment cut off by the edge, not the (huge)
+            # circle.
+            box = np.column_stack((centers - radii[:, None], centers + radii[:, None]))
+            for j in range(3):
+                e0 = points[tri.simplices[:, (j + 1) % 3]]
+                e1 = points[tri.simplices[:, (j + 2) % 3]]
+                edge = e1 - e0
+                normal = np.column_stack((edge[:, 1], -edge[:, 0]))
+                normal /= np.sqrt((normal ** 2).sum(axis = 1))[:, None]
+                # outwards, away from the opposite vertex
+                flip = ((points[tri.simplices[:, j]] - e0) * normal).sum(axis = 1) > 0
+                normal[flip] *= -1
+                beyond = ((centers - e0) * normal).sum(axis = 1)
+                cut = (tri.neighbors[:, j] == -1) & (beyond > 0)
+                sagitta = (radii - beyond)[:, None] * normal
+                corners = np.stack((e0, e1, e0 - sagitta, e1 - sagitta))
+                box[cut, :2] = np.maximum(box[cut, :2], corners.min(axis = 0)[cut])
+                box[cut, 2:] = np.minimum(box[cut, 2:], corners.max(axis = 0)[cut])
+            # flat triangles have no circumcircle, keep them everywhere
+            box[~np.isfinite(box).all(axis = 1)] = [-np.inf, -np.inf, np.inf, np.inf]
+
+        x_lo, x_hi = _hullRows(points, tri.convex_hull, h)
+
+        extents = []
+        for r0, r1, c0, c1 in cores:
+            # triangles reaching a pixel of the core inside the hull, with
+            # half a pixel of slack
+            near = (box[:, 0] <= c1 - 0.5) & (box[:, 2] >= c0 - 0.5) \
+                & (box[:, 1] <= r1 - 0.5) & (box[:, 3] >= r0 - 0.5)
+            if support == 'circumcircle':
+                dx = np.maximum(np.maximum(c0 - centers[:, 0], centers[:, 0] - (c1 - 1)), 0)
+                dy = np.maximum(np.maximum(r0 - centers[:, 1], centers[:, 1] - (r1 - 1)), 0)
+                with np.errstate(invalid = 'ignore'):
+                    near &= ~(dx ** 2 + dy ** 2 > (radii + 0.5) ** 2)
+            near = np.flatnonzero(near)
+            needed = [tri.simplices[near].ravel()]
+
+            # pixels of the core outside (or on) the hull take the nearest
+            # sample
+            Z, Y = np.mgrid[r0:r1, c0:c1]
+            lo, hi = x_lo[r0:r1, None], x_hi[r0:r1, None]
+            with np.errstate(invalid = 'ignore'):
+                outside = ~((Y > lo + 0.5) & (Y < hi - 0.5))
+            if outside.any():
+                _, nearest = tree.query(np.column_stack((Y[outside], Z[outside])))
+                needed.append(np.asarray(nearest).ravel())
+
+            needed = np.concatenate(needed)
+            extents.append((min(r0, rows[needed].min()), max(r1, rows[needed].max() + 1), \
+                min(c0, cols[needed].min()), max(c1, cols[needed].max() + 1)))
+        return extents
+
+    def interpolate(self, shape, samples, vec, backend, out = None, support = None, plan = None):
+        '''
+        Interpolates a frame tile by tile.
+
+        Args:
+            shape: Shape of the depth matrix
+
+            samples: List of flattened indices of non-NaN values
+            in depth matrix
+
+            vec: List of depth values at the indices
+            given by the previous list
+
+            backend: Interpolation taking (shape, samples, vec) and
+            returning the depth matrix, e.g. voronoi.getVoronoiRaster, or
+            the name of a sample based backend of backends.py
+
+            out: Optional preallocated output matrix (e.g. from
+            FramePlan.buffer())
+
+            support: Samples the backend depends on, 'nearest', 'triangle'
+            or 'circumcircle' (see the module description). Known for the
+            backends of backends.py, required for other backends unless
+            the executor has a fixed halo.
+
+            plan: Optional FramePlan, the tile extents are then cached and
+            reused for as long as the samples stay the same
+
+        Returns:
+            matrix: New depth matrix
+        '''
+        h, w = shape
+        samples = np.asarray(samples)
+        vec = np.asarray(vec)
+        if out is None:
+            out = np.empty(shape)
+
+        cores = self._cores(shape)
+        if self.halo is None:
+            if support is None:
+                support = _SUPPORT.get(backend) if isinstance(backend, str) else None
+            if support not in ('nearest', 'triangle', 'circumcircle'):
+                raise ValueError('unknown support of the backend, give support or a halo')
+
+            build = lambda: self._extents(shape, samples, support)
+            if plan is not None:
+                extents = plan.operator('tiled_{0}_{1}x{2}'.format(support, *self.tiles), \
+                    shape, samples, build)
+            else:
+                extents = build()
+            if extents is None:
+                # nothing to split, every pixel depends on every sample
+                out[:] = _run((backend, tuple(shape), samples, vec))
+                self.area = 1.0
+                return out
+        else:
+            halo = self.halo
+            extents = [(max(0, r0 - halo), min(h, r1 + halo), \
+                max(0, c0 - halo), min(w, c1 + halo)) for r0, r1, c0, c1 in cores]
+
+        rows, cols = np.divmod(samples, w)
+        tasks = []
+        for er0, er1, ec0, ec1 in extents:
+            inside = (rows >= er0) & (rows < er1) & (cols >= ec0) & (cols < ec1)
+            local = (rows[inside] - er0) * (ec1 - ec0) + (cols[inside] - ec0)
+            tasks.append((backend, (er1 - er0, ec1 - ec0), local, vec[inside]))
+
+        tiles = self.pool.map(_run, tasks)
+        for tile, (r0, r1, c0, c1), (er0, er1, ec0, ec1) in zip(tiles, cores, extents):
+            out[r0:r1, c0:c1] = tile[r0 - er0:r1 - er0, c0 - ec0:c1 - ec0]
+        self.area = sum((er1 - er0) * (ec1 - ec0) for er0, er1, ec0, ec1 in extents) / float(h * w)
+        return out
+
+def main():
+    '''
+    Unit tests
+    '''
+    from create_samples import createSamples
+    from voronoi import getVoronoiRaster
+    import linear_interpolation
+    import natural_neighbor
+
+    h = 480
+    w = 640
+    perc_samples = 0.01
+
+    np.random.seed(54)
+    depth = 6.0 * np.random.rand(h, w)
+    depth[np.random.rand(h, w) < 0.5] = np.nan
+    samples, vec = createSamples(depth, perc_samples)
+
+    from frame_plan import FramePlan
+
+    executor = TiledExecutor(tiles = (2, 2))
+    plan = FramePlan()
+    for name, interpolate, backend, support in [ \
+        ('nearest', getVoronoiRaster, getVoronoiRaster, 'nearest'), \
+        ('delaunay linear', linear_interpolation.interpolate, 'linear', None), \
+        ('natural neighbor', natural_neighbor.interpolate, 'natural_neighbor', None)]:
+        t1 = time.time()
+        whole = interpolate(depth.shape, samples, vec)
+        t2 = time.time()
+        tiled = executor.interpolate(depth.shape, samples, vec, backend, support = support, plan = plan)
+        t3 = time.time()
+        executor.interpolate(depth.shape, samples, vec, backend, support = support, plan = plan)
+        t4 = time.time()
+        difference = np.abs(whole - tiled)
+        print('{0}: whole {1:.3f} s, tiled {2:.3f} s ({3:.3f} s with cached extents), tiles cover {4:.2f}x the frame'.format(\
+            name, t2 - t1, t3 - t2, t4 - t3, executor.area))
+        print('    largest difference {0:.2g}, {1} pixels over 1e-6'.format(\
+            np.nanmax(difference), (difference > 1e-6).sum()))
+    executor.close()
+
+if __name__== "__main__":
+    main()
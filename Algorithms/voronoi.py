@@ -6,12 +6,13 @@ Voronoi interpolation.
 
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.spatial import Voronoi
+from scipy.spatial import Voronoi, cKDTree
+from scipy.ndimage import distance_transform_edt
 from shapely.geometry import Polygon
 from matplotlib.path import Path
 from colorized_voronoi import voronoi_finite_polygons_2d
 
-def getVoronoi(shape, samples, vec):
+def getVoronoi(shape, samples, vec, plan = None):
     '''
     Constructs new depth image by creating Voronoi regions.
     
@@ -24,6 +25,10 @@ def getVoronoi(shape, samples, vec):
         vec: List of depth values at the indices
         given by the previous list
 
+        plan: Optional FramePlan providing the pixel grid and the output
+        buffer. The returned matrix is then a view of that buffer and is
+        overwritten by the next call.
+
         * NOTE: samples and vec must be obtained from the function
         create_samples.createSamples()
 
@@ -32,24 +37,31 @@ def getVoronoi(shape, samples, vec):
     '''
     h, w = shape
 
-    he = np.arange(0, h)
-    wi = np.arange(0, w)
+    if plan is not None:
+        Y, Z = plan.grid(shape)
+    else:
+        he = np.arange(0, h)
+        wi = np.arange(0, w)
 
-    Yq, Zq = np.meshgrid(wi, he)
-    Y_sample = Yq.flatten()[samples]
-    Z_sample = Zq.flatten()[samples]
+        Yq, Zq = np.meshgrid(wi, he)
+        Y, Z = Yq.ravel(), Zq.ravel()
+    Y_sample = Y[samples]
+    Z_sample = Z[samples]
 
     points = np.column_stack((Y_sample, Z_sample))
     voronoi = Voronoi(points)
 
-    regions, vertices = voronoi_finite_polygons_2d(voronoi)
-    reconstructed = np.zeros((w, h))
+    regions, offsets, vertices = voronoi_finite_polygons_2d(voronoi)
     b = Polygon([(0, 0), (w-1, 0), (w-1, h-1), (0, h-1)])
 
-    reconstructed = np.zeros((w, h))
+    if plan is not None:
+        reconstructed = plan.buffer('voronoi', (w, h))
+        reconstructed.fill(0)
+    else:
+        reconstructed = np.zeros((w, h))
 
-    for i, region in enumerate(regions):
-        polygon = vertices[region]
+    for i in range(len(samples)):
+        polygon = vertices[regions[offsets[i]:offsets[i + 1]]]
         shape = Polygon(polygon)
         if not b.contains(shape):
             shape = shape.intersection(b)
@@ -82,6 +94,183 @@ def getVoronoi(shape, samples, vec):
 
     return reconstructed.T
 
+def getVoronoiRaster(shape, samples, vec, method = 'edt', distances = False, plan = None):
+    '''
+    Constructs the same nearest-sample (Voronoi) depth image as
+    getVoronoi(), directly on the pixel grid instead of through polygons.
+
+    Args:
+        shape: Shape of the depth matrix
+
+        samples: Flattened indices of non-NaN values in depth matrix
+
+        vec: Depth values at the indices given by the previous array
+
+        method: 'edt' assigns every pixel its nearest sample with one
+        exact Euclidean distance transform over the sample mask, 'kdtree'
+        queries a KD-tree of the samples with every pixel
+
+        distances: Also return the distance (in pixels) from every pixel
+        to its nearest sample, a measure of how much to trust the value
+
+        plan: Optional FramePlan providing the pixel grid ('kdtree' only)
+
+        * NOTE: samples and vec must be obtained from the function
+        create_samples.createSamples()
+
+    Returns:
+        matrix: New depth matrix, all NaN if there are no samples
+
+        (matrix: Distance to the nearest sample if distances is True)
+    '''
+    h, w = shape
+    samples = np.asarray(samples)
+    vec = np.asarray(vec)
+
+    if len(samples) == 0:
+        filled = np.full(shape, np.nan)
+        if distances:
+            return filled, np.full(shape, np.inf)
+        return filled
+
+    if method == 'edt':
+        # distance to the nearest zero, i.e. the nearest sample
+        mask = np.ones(h * w, dtype = bool)
+        mask[samples] = False
+        dist, (rows, cols) = distance_transform_edt(mask.reshape(shape), \
+            return_indices = True)
+        values = np.zeros(h * w, dtype = vec.dtype)
+        values[samples] = vec
+        filled = values[rows * w + cols]
+
+    elif method == 'kdtree':
+        if plan is not None:
+            Y, Z = plan.grid(shape)
+        else:
+            Yq, Zq = np.meshgrid(np.arange(0, w), np.arange(0, h))
+            Y, Z = Yq.ravel(), Zq.ravel()
+        tree = cKDTree(np.column_stack((Y[samples], Z[samples])))
+        dist, nearest = tree.query(np.column_stack((Y, Z)))
+        filled = vec[nearest].reshape(shape)
+        dist = dist.reshape(shape)
+
+    else:
+        raise ValueError('unknown method: {0}'.format(method))
+
+    if distances:
+        return filled, dist
+    return filled
+
+class VoronoiMap:
+    """
+    Pixel-to-sample assignment of a fixed sampling pattern. The Voronoi
+    partition of a pattern never changes, so it is computed once and every
+    frame is rendered with a gather.
+    """
+    def __init__(self, shape, pattern, k = 8):
+        '''
+        Assigns every pixel its k nearest pattern locations, nearest first.
+
+        Args:
+            shape: Shape of the depth matrix
+
+            pattern: Sorted flattened indices of the sampling pattern
+            (e.g. FramePlan.pattern())
+
+            k: Number of fallback locations kept per pixel, used when the
+            nearest ones sampled NaN
+        '''
+        h, w = shape
+        self.shape = tuple(shape)
+        self.pattern = np.asarray(pattern)
+        self.k = max(1, min(k, len(self.pattern)))
+
+        rows, cols = np.divmod(self.pattern, w)
+        tree = cKDTree(np.column_stack((cols, rows)))
+        Yq, Zq = np.meshgrid(np.arange(0, w), np.arange(0, h))
+        _, labels = tree.query(np.column_stack((Yq.ravel(), Zq.ravel())), k = self.k)
+        # (k, pixels), so that every rank is a contiguous gather
+        self.labels = np.ascontiguousarray(labels.reshape(h * w, self.k).T.astype(np.int32))
+
+        # the k nearest pattern locations of every location and the number
+        # of pixels it is nearest to, a pixel's k nearest locations are
+        # about those of its own location
+        _, near = tree.query(tree.data, k = self.k)
+        self.near = near.reshape(len(self.pattern), self.k)
+        self.area = np.bincount(self.labels[0], minlength = len(self.pattern))
+
+    def render(self, samples, vec):
+        '''
+        Constructs the nearest-sample depth image of one frame.
+
+        Args:
+            samples: Flattened indices of the non-NaN samples, a subset of
+            the pattern (as returned by createSamples with the same plan)
+
+            vec: Depth values at the indices given by the previous array
+
+        Returns:
+            matrix: New depth matrix
+        '''
+        values = np.full(len(self.pattern), np.nan)
+        values[np.searchsorted(self.pattern, samples)] = vec
+
+        # pixels expected to have no valid sample among their k nearest
+        # locations, if that many need a search one raster fill is cheaper
+        hole = np.isnan(values[self.near]).all(axis = 1)
+        if np.dot(self.area, hole) * 32 > self.labels.shape[1]:
+            return getVoronoiRaster(self.shape, samples, vec)
+
+        filled = values[self.labels[0]]
+        if len(samples) == len(self.pattern):
+            return filled.reshape(self.shape)
+
+        # nearest valid sample among the k nearest pattern locations, only
+        # the pixels still missing are looked at again
+        missing = np.flatnonzero(np.isnan(filled))
+        for rank in range(1, self.k):
+            if len(missing) == 0:
+                break
+            candidate = values[self.labels[rank, missing]]
+            found = ~np.isnan(candidate)
+            filled[missing[found]] = candidate[found]
+            missing = missing[~found]
+
+        if len(missing):
+            # search the valid samples for the remaining pixels only
+            w = self.shape[1]
+            rows, cols = np.divmod(np.asarray(samples), w)
+            _, nearest = cKDTree(np.column_stack((cols, rows))).query(\
+                np.column_stack((missing % w, missing // w)))
+            filled[missing] = np.asarray(vec)[nearest]
+
+        return filled.reshape(self.shape)
+
+def getVoronoiMapped(shape, samples, vec, plan):
+    '''
+    Constructs the nearest-sample depth image using the cached VoronoiMap
+    of the plan's fixed sampling pattern.
+
+    Args:
+        shape: Shape of the depth matrix
+
+        samples: Flattened indices of non-NaN values in depth matrix
+
+        vec: Depth values at the indices given by the previous array
+
+        plan: FramePlan the samples were drawn with
+
+        * NOTE: samples and vec must be obtained from the function
+        create_samples.createSamples() with the same plan
+
+    Returns:
+        matrix: New depth matrix
+    '''
+    pattern = plan.pattern(shape)
+    vmap = plan.operator('voronoi_map', shape, pattern, \
+        lambda: VoronoiMap(shape, pattern))
+    return vmap.render(samples, vec)
+
 def main():
     """
     Application example with visualization.
@@ -105,6 +294,23 @@ def main():
     t2 = time.time()
     print('Time to create samples and get Voronoi: ' + str(t2 - t1))
 
+    # camera sized frame with half of the pixels missing, 1% sampling
+    from frame_plan import FramePlan
+    plan = FramePlan(perc_samples = 0.01)
+    frame = np.full((480, 640), 2.0)
+    frame[np.random.sample(frame.shape) < 0.5] = np.nan
+    samples, vec = createSamples(frame, plan.perc_samples, plan = plan)
+    getVoronoiMapped(frame.shape, samples, vec, plan)
+    t1 = time.time()
+    for _ in range(10):
+        getVoronoiMapped(frame.shape, samples, vec, plan)
+    t2 = time.time()
+    for _ in range(10):
+        getVoronoiRaster(frame.shape, samples, vec)
+    t3 = time.time()
+    print('Time per 480x640 frame, mapped: ' + str((t2 - t1) / 10) + \
+        ', raster: ' + str((t3 - t2) / 10))
+
     figsize = (6, 2.5)
     plt.figure(figsize = figsize)
 
@@ -6,10 +6,14 @@ Description: Module to connect to camera and retrieve RGB and depth data. Curren
 import numpy as np
 import logging
 import time
+import threading
 import cv2
 import matplotlib.pyplot as plt
 from skimage.transform import rescale
 from file_support import ensureDir
+from frame_buffer import FrameBuffer
+from frame_writer import FrameWriter
+from downsample import downsample, areaMean
 from os import path, makedirs
 
 try:
@@ -22,124 +26,639 @@ class Camera:
     Object to get data from R200
     """
     def __init__(self, max_depth = 4.0, save_images = False, \
-        t_buffer = 5, output_dir = './Trials/'):
+        t_buffer = 5, output_dir = './Trials/', buffer_size = 60, \
+        reduce_method = 'mean', max_queue = 32, drop_policy = 'newest', \
+        raw_depth = False, record_format = 'npy', downsample_method = 'rescale', \
+        device_id = 0):
         """
         Intitalizes Camera object 
+
+        Args:
+            buffer_size: Number of depth frames the averaging buffer holds,
+            grown on demand if more frames are requested
+            reduce_method: How frames are averaged, one of 'mean',
+            'median' or 'sigma_clip' (see FrameBuffer.reduce)
+            t_buffer: Minimum seconds between saved frames, 0 saves every
+            frame
+            max_queue: Number of frames the image writer may hold before
+            it starts dropping (see FrameWriter)
+            drop_policy: What the image writer drops when its queue is full
+            raw_depth: Keep depth frames in the sensor's uint16 units (0
+            marks invalid pixels) instead of meters. Frames are averaged
+            and masked as integers, reduceFrame converts only the kept
+            region to meters using depth_scale.
+            record_format: 'npy' saves one .npy file per frame, 'recording'
+            appends the frames to a chunked recording (see recording.py)
+            downsample_method: Default downsampling backend of reduceFrame
+            device_id: Index of the R200 to connect to
         """
         self.max_depth = max_depth
+        self.device_id = device_id
+        self.own_serv = True
+        self.raw_depth = raw_depth
+        self.downsample_method = downsample_method
+        self.depth_scale = 0.001
+        self.buffer_size = buffer_size
+        self.reduce_method = reduce_method
+        self.dev = None
+        self.buffer = None
+        self.adaptive_buffer = None
+        self.color = None
+        self.capture_thread = None
+        self.capturing = False
+        self.capture_rgb = False
+        self.new_frame = threading.Condition()
         self.save_images = save_images
         self.clock = time.time()
         self.t_buffer = t_buffer
         self.output_dir = output_dir
         self.data_dir = path.join(self.output_dir,"{}".format(time.strftime("%d_%b_%Y_%H:%M", time.localtime())))
 
+        self.writer = None
+
         if self.save_images:	
             ensureDir(self.data_dir)
+            self.writer = FrameWriter(self.data_dir, max_queue = max_queue, \
+                drop_policy = drop_policy, \
+                container = (record_format == 'recording'))
+            self.writer.start()
         pass
 
         np.warnings.filterwarnings('ignore')
 
-    def connect(self):
+    def connect(self, serv = None):
         """
         Establishes connection to R200 camera
+
+        Args:
+            serv: pyrealsense Service to open the device with, shared by
+            several cameras. A new one is started (and stopped on
+            disconnect) if None.
         """
         logging.info("Cam.py: connecting components")
-        self.serv = pyrs.Service()
-        self.dev = self.serv.Device(device_id=0, 
+        self.own_serv = serv is None
+        if serv is None:
+            serv = pyrs.Service()
+        self.serv = serv
+        self.dev = self.serv.Device(device_id=self.device_id, 
                                     streams=[\
                                         pyrs.stream.DepthStream(fps=60), pyrs.stream.ColorStream(fps=60)])
+        self.depth_scale = self.dev.depth_scale
+        if self.writer is not None:
+            self.writer.depth_scale = self.depth_scale
 
     def disconnect(self):
         """
         Disconnects from R200 camera
         """
+        self.stopCapture()
+        if self.writer is not None:
+            self.writer.stop()
         self.dev.stop()
-        self.serv.stop()
+        if self.own_serv:
+            self.serv.stop()
         logging.info("Cam.py: camera disconnected")
 
-    def getFrames(self, frames = 5, rgb = False):
+    def _getBuffer(self, frames, shape):
         """
-        Retrieves depth frames (and RGB if true) from R200 input, cleans and averages depth images
+        Returns the frame buffer, allocating it on first use (or when more
+        frames are requested than it can hold)
+        """
+        if self.buffer is None or self.buffer.capacity < frames \
+            or self.buffer.shape != tuple(shape):
+            capacity = max(frames, self.buffer_size)
+            dtype = np.uint16 if self.raw_depth else np.float64
+            self.buffer = FrameBuffer(capacity, shape, dtype = dtype)
+        return self.buffer
+
+    def _depthScale(self):
+        """
+        Factor applied to depth frames when they enter the buffer, None
+        keeps the raw sensor units
+        """
+        if self.raw_depth:
+            return None
+        return self.dev.depth_scale
+
+    def _saveFrame(self, stamp, depth, col):
+        """
+        Hands a depth (and color) frame to the image writer if save_images
+        is set and at least t_buffer seconds passed since the last save.
+        The files are written on the writer's thread.
+        """
+        if self.save_images and (stamp - self.clock >= self.t_buffer):
+            self.writer.write(stamp, depth, col)
+            self.clock = stamp
+
+    def waitUntilReady(self, timeout = 5.0, window = 10, interval_tol = 0.25, \
+        coverage_tol = 0.05):
+        """
+        Polls frames until the R200 has stabilized: the last window frames
+        arrived at a steady rate and their fraction of valid depth pixels
+        stopped changing. Replaces a fixed sleep after connect().
+
+        Args:
+            timeout: Maximum seconds to wait
+            window: Number of consecutive frames that must be stable
+            interval_tol: Maximum relative deviation of a frame interval
+            from the median interval of the window
+            coverage_tol: Maximum spread of the valid pixel fraction over
+            the window
+
+        Returns:
+            bool: True once the camera is stable, False on timeout
+        """
+        t_start = time.time()
+        stamps = []
+        fractions = []
+        last = None
+
+        while time.time() - t_start < timeout:
+            if self.capture_thread is not None:
+                with self.new_frame:
+                    while self.capturing and (self.buffer is None or self.buffer.count == 0 \
+                        or self.buffer.newestStamp() == last):
+                        self.new_frame.wait(0.1)
+                        if time.time() - t_start >= timeout:
+                            break
+                    if self.buffer is None or self.buffer.count == 0 \
+                        or self.buffer.newestStamp() == last:
+                        continue
+                    last = self.buffer.newestStamp()
+                    frame = self.buffer.newest()
+                    valid = np.count_nonzero(frame > 0) if self.raw_depth \
+                        else np.count_nonzero(~np.isnan(frame))
+                    stamps.append(last)
+                    fractions.append(valid / float(frame.size))
+            else:
+                self.dev.wait_for_frames()
+                stamps.append(time.time())
+                depth = self.dev.depth
+                fractions.append(np.count_nonzero(depth) / float(depth.size))
+
+            if len(stamps) <= window:
+                continue
+
+            intervals = np.diff(stamps[-(window + 1):])
+            median = np.median(intervals)
+            steady = median > 0 and \
+                np.max(np.abs(intervals - median)) <= interval_tol * median
+            settled = np.ptp(fractions[-window:]) <= coverage_tol
+
+            if steady and settled:
+                logging.info("Cam.py: camera ready after {0:.2f} s".format(time.time() - t_start))
+                return True
+
+        logging.warning("Cam.py: camera not stable after {0} s".format(timeout))
+        return False
+
+    def startCapture(self, rgb = False):
+        """
+        Starts a background thread that keeps pulling frames from the R200
+        into the frame buffer. While it runs, getFrames returns at once with
+        an average of the newest buffered frames instead of waiting on the
+        sensor.
+
+        Args:
+            rgb: Also keep the newest color image, color capture is skipped
+            otherwise
+        """
+        if self.capture_thread is not None:
+            return
+
+        if self.buffer is not None:
+            self.buffer.clear()
+        self.capture_rgb = rgb
+        self.capturing = True
+        self.capture_thread = threading.Thread(target = self._captureLoop)
+        self.capture_thread.daemon = True
+        self.capture_thread.start()
+        logging.info("Cam.py: background capture started")
+
+    def stopCapture(self):
+        """
+        Stops the background capture thread, if running
+        """
+        if self.capture_thread is None:
+            return
+
+        self.capturing = False
+        self.capture_thread.join()
+        self.capture_thread = None
+        logging.info("Cam.py: background capture stopped")
+
+    def _captureLoop(self):
+        """
+        Body of the background capture thread
+        """
+        try:
+            while self.capturing:
+                self.dev.wait_for_frames()
+                stamp = time.time()
+                raw = self.dev.depth
+                col = None
+                if self.capture_rgb or self.save_images:
+                    col = self.dev.color
+
+                with self.new_frame:
+                    buf = self._getBuffer(1, raw.shape)
+                    depth = buf.push(raw, scale = self._depthScale(), stamp = stamp)
+                    if col is not None:
+                        self.color = col
+                    self.new_frame.notify_all()
+
+                if self.save_images:
+                    self._saveFrame(stamp, depth, col)
+        except Exception as error:
+            logging.error("Cam.py: background capture failed: " + str(error))
+            with self.new_frame:
+                self.capturing = False
+                self.new_frame.notify_all()
+
+    def _getBufferedFrames(self, frames, rgb, method, timeout):
+        """
+        Averages the newest buffered frames of the background capture
+        thread, waiting only if no (color) frame has arrived yet
+        """
+        with self.new_frame:
+            if rgb and not self.capture_rgb:
+                # color was not being captured, wait for the next frame
+                self.capture_rgb = True
+                self.color = None
+
+            deadline = time.time() + timeout
+            while self.capturing and (self.buffer is None \
+                or self.buffer.count == 0 or (rgb and self.color is None)):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.new_frame.wait(remaining)
+
+            if self.buffer is None or self.buffer.count == 0:
+                raise RuntimeError('no frames received from background capture')
+
+            n = min(frames, self.buffer.count)
+            depth = self.buffer.reduce(n, method = method)
+            stamp = self.buffer.newestStamp()
+            col = self.color
+
+        return depth, col, stamp
+
+    def _pullFrame(self, buf, rgb = False):
+        """
+        Waits for the next frame, pushes its depth into buf and hands it to
+        the image writer. Returns the buffer slot and the color image (None
+        unless rgb or save_images is set).
         """
         self.dev.wait_for_frames()
+        # Convert depth to meters (unless raw_depth is set)
+        stamp = time.time()
+        depth = buf.push(self.dev.depth, scale = self._depthScale(), stamp = stamp)
+        col = None
+        if rgb or self.save_images:
+            col = self.dev.color
+            self._saveFrame(stamp, depth, col)
+        return depth, col
+
+    def _validMask(self, depth):
+        """
+        Returns where a (buffered or averaged) depth matrix holds a usable
+        reading, i.e. valid and not beyond max_depth
+        """
+        if self.raw_depth:
+            return (depth > 0) & (depth <= self.max_depth / self.depth_scale)
+        with np.errstate(invalid = 'ignore'):
+            return depth <= self.max_depth
+
+    def _maskFar(self, depth):
+        """
+        Marks readings beyond max_depth invalid, in place
+        """
+        if self.raw_depth:
+            depth[depth > self.max_depth / self.depth_scale] = 0
+        else:
+            depth[depth > self.max_depth] = np.nan
+
+    def latestStamp(self):
+        """
+        Returns the capture time of the newest frame of the background
+        capture thread, None if there is none yet
+        """
+        with self.new_frame:
+            if self.buffer is None or self.buffer.count == 0:
+                return None
+            return self.buffer.newestStamp()
+
+    def getFramesAt(self, stamp, frames = 5, method = None):
+        """
+        Averages the buffered frames of the background capture thread that
+        end with the frame captured closest to stamp. Used to line up the
+        frames of several cameras.
+
+        Args:
+            stamp: Capture time to align to
+            frames: Number of depth frames to average
+            method: Reduction used to average the frames
+
+        Returns:
+            matrix: Averaged depth matrix
 
-        # Convert depth to meters
-        depth = self.dev.depth * self.dev.depth_scale
-        col = self.dev.color
+            float: Capture time of the newest frame used
+        """
+        if self.capture_thread is None:
+            raise RuntimeError('getFramesAt needs background capture, see startCapture()')
+        if method is None:
+            method = self.reduce_method
+
+        with self.new_frame:
+            if self.buffer is None or self.buffer.count == 0:
+                raise RuntimeError('no frames received from background capture')
+            skip = self.buffer.closest(stamp)
+            n = min(frames, self.buffer.count - skip)
+            depth = self.buffer.reduce(n, method = method, skip = skip)
+            frame_stamp = self.buffer.stampAt(skip)
+
+        self._maskFar(depth)
+        return depth, frame_stamp
+
+    def getFrames(self, frames = 5, rgb = False, method = None, \
+        stamped = False, timeout = 1.0):
+        """
+        Retrieves depth frames (and RGB if true) from R200 input, cleans and averages depth images
+
+        Args:
+            frames: Number of depth frames to average
+            rgb: Also return the color image of the first frame (newest
+            frame during background capture)
+            method: Reduction used to average the frames, defaults to the
+            Camera's reduce_method
+            stamped: Also return the capture time of the newest frame used
+            and its age in seconds
+            timeout: Seconds to wait for a first frame during background
+            capture
+        """
+        if method is None:
+            method = self.reduce_method
 
-        if self.save_images and (time.time() - self.clock > self.t_buffer):
-            np.save(path.join(self.data_dir,str(time.time())+"_d"),depth)
-            np.save(path.join(self.data_dir,str(time.time())+"_c"),col)
-            self.clock = time.time()
+        if self.capture_thread is not None:
+            depth, col, stamp = self._getBufferedFrames(frames, rgb, method, timeout)
 
-        for _ in range(frames-1):
+        else:
             self.dev.wait_for_frames()
-            # Convert depth to meters
-            curr = self.dev.depth * self.dev.depth_scale
-            depth = np.dstack((depth, curr))
+            buf = self._getBuffer(frames, self.dev.depth.shape)
+            buf.clear()
 
-        if frames != 1:
-            depth = np.nanmean(depth, 2)
+            # first frame was already waited for above
+            stamp = time.time()
+            depth = buf.push(self.dev.depth, scale = self._depthScale(), stamp = stamp)
+            col = None
+            if rgb or self.save_images:
+                col = self.dev.color
+                self._saveFrame(stamp, depth, col)
 
-        depth[depth <= 0] = np.nan
-        depth[depth > self.max_depth] = np.nan
+            for _ in range(frames-1):
+                self._pullFrame(buf)
+
+            depth = buf.reduce(frames, method = method)
+            stamp = buf.newestStamp()
+
+        self._maskFar(depth)
+
+        if stamped:
+            age = time.time() - stamp
+            if rgb:
+                return depth, col, stamp, age
+            return depth, stamp, age
 
         if rgb:
             return depth, col
 
         return depth
 
-    def reduceFrame(self, depth, height_ratio = 0.5, sub_sample = 0.3, reduce_to = 'lower'):
+    def getFramesAdaptive(self, coverage = 0.5, max_frames = 60, deadline = None, \
+        height_ratio = 0.5, reduce_to = 'lower', rgb = False, method = None, \
+        plan = None):
         """
-        Takes in a depth image and rescales it
+        Averages only as many depth frames as needed: frames are added until
+        the given fraction of the region reduceFrame keeps has a valid
+        reading, the deadline passes or max_frames is reached. During
+        background capture the newest buffered frames are used instead of
+        waiting for new ones. Readings beyond max_depth are dropped from
+        every frame before averaging, so that the average is valid wherever
+        one of its frames was.
 
         Args:
+            coverage: Target fraction of valid pixels in the kept region
+            max_frames: Maximum number of frames to average
+            deadline: Maximum seconds to spend collecting frames, None for
+            no limit (at least one frame is always used)
+            height_ratio: Fraction of rows reduceFrame will keep
+            reduce_to: Band of rows reduceFrame will keep
+            rgb: Also return the color image of the first frame
+            method: Reduction used to average the frames
+            plan: Optional FramePlan, overrides height_ratio and reduce_to
+
+        Returns:
+            matrix: Averaged depth matrix
+
+            (matrix: Color image if rgb is True)
+
+            float: Fraction of the kept region with a valid reading
+
+            int: Number of frames averaged
+        """
+        if method is None:
+            method = self.reduce_method
+        if plan is not None:
+            height_ratio = plan.height_ratio
+            reduce_to = plan.reduce_to
+        t_end = None if deadline is None else time.time() + deadline
+
+        if self.capture_thread is not None:
+            with self.new_frame:
+                buf = self.buffer
+                if buf is None or buf.count == 0:
+                    raise RuntimeError('no frames received from background capture')
+                rows, cols = self.cropSlices(buf.shape, height_ratio, reduce_to)
+                covered = np.zeros(buf.frames[0][rows, cols].shape, dtype = bool)
+                limit = min(max_frames, buf.count)
+
+                # the shared buffer is left as it is, the frames used are
+                # copied to a private one and masked there
+                work = self.adaptive_buffer
+                if work is None or work.capacity < limit or work.shape != buf.shape \
+                    or work.frames.dtype != buf.frames.dtype:
+                    work = FrameBuffer(max(limit, self.buffer_size), buf.shape, \
+                        dtype = buf.frames.dtype)
+                    self.adaptive_buffer = work
+                work.clear()
+
+                n = 0
+                while n < limit:
+                    i = (buf.head - 1 - n) % buf.capacity
+                    frame = work.push(buf.frames[i], stamp = buf.stamps[i])
+                    self._maskFar(frame)
+                    covered |= self._validMask(frame[rows, cols])
+                    n += 1
+                    if covered.mean() >= coverage \
+                        or (t_end is not None and time.time() >= t_end):
+                        break
+                depth = work.reduce(n, method = method)
+                col = self.color
+
+        else:
+            self.dev.wait_for_frames()
+            buf = self._getBuffer(max_frames, self.dev.depth.shape)
+            buf.clear()
+            rows, cols = self.cropSlices(buf.shape, height_ratio, reduce_to)
+
+            stamp = time.time()
+            frame = buf.push(self.dev.depth, scale = self._depthScale(), stamp = stamp)
+            col = None
+            if rgb or self.save_images:
+                col = self.dev.color
+                self._saveFrame(stamp, frame, col)
+            self._maskFar(frame)
+            covered = self._validMask(frame[rows, cols])
+            n = 1
+
+            while n < max_frames and covered.mean() < coverage \
+                and (t_end is None or time.time() < t_end):
+                frame, _ = self._pullFrame(buf)
+                self._maskFar(frame)
+                covered |= self._validMask(frame[rows, cols])
+                n += 1
+
+            depth = buf.reduce(n, method = method)
+
+        achieved = float(self._validMask(depth[rows, cols]).mean())
+
+        if rgb:
+            return depth, col, achieved, n
+
+        return depth, achieved, n
+
+    def cropSlices(self, shape, height_ratio = 0.5, reduce_to = 'lower'):
+        """
+        Returns the (rows, columns) slices of a depth image that
+        reduceFrame keeps
+
+        Args:
+            shape: Shape of the depth matrix
             height_ratio: Determines fraction of rows to keep
-            sub_sample: Scaling factor for image
+            reduce_to: Band of rows to keep, one of 'lower', 'middle_lower',
+            'middle', 'middle_upper' and 'upper'
         """
-        if (height_ratio > 1.0) or (height_ratio < 0.0)\
-            or (sub_sample > 1.0) or (sub_sample < 0.0):
-            print('height_ratio and sub_sample must be between 0 and 1')
-            exit(1)
-        
-        depth_copy = depth.copy()
-        height = depth_copy.shape[0]
+        height = shape[0]
         h = int(height_ratio*(height))
         cols_to_cut = 0
+        cols = slice(cols_to_cut, -(cols_to_cut+1))
 
         # catches the case when all rows are kept
         if height_ratio == 1:
-            d_short = depth_copy
+            return slice(None), slice(None)
 
         elif reduce_to == 'lower':
-            d_short = depth_copy[(height - h):,\
-                cols_to_cut:-(cols_to_cut+1)]
+            return slice(height - h, None), cols
 
         elif reduce_to == 'middle_lower':
             upper_brdr = int(3*(height/4.0) - h/2)
-            lower_brdr = upper_brdr + h
-            d_short = depth_copy[upper_brdr:lower_brdr,\
-                cols_to_cut:-(cols_to_cut+1)]
 
         elif reduce_to == 'middle':
             upper_brdr = int((height - h)/2.0)
-            lower_brdr = upper_brdr + h
-            d_short = depth_copy[upper_brdr:lower_brdr,\
-                cols_to_cut:-(cols_to_cut+1)]
 
         elif reduce_to == 'middle_upper':
             upper_brdr = int((height/4.0) - h/2)
-            lower_brdr = upper_brdr + h
-            d_short = depth_copy[upper_brdr:lower_brdr,\
-                cols_to_cut:-(cols_to_cut+1)]
 
         elif reduce_to == 'upper':
-            d_short = depth_copy[:h, cols_to_cut:-(cols_to_cut+1)]
+            return slice(None, h), cols
+
+        else:
+            raise ValueError('unknown reduce_to: {0}'.format(reduce_to))
+
+        lower_brdr = upper_brdr + h
+        return slice(upper_brdr, lower_brdr), cols
+
+    def reduceFrame(self, depth, height_ratio = 0.5, sub_sample = 0.3, \
+        reduce_to = 'lower', out = None, method = None, counts = False, \
+        plan = None):
+        """
+        Takes in a depth image and rescales it
+
+        Args:
+            depth: Depth matrix in meters, or in raw sensor units (integer
+            dtype, see raw_depth) in which case only the kept region is
+            converted to meters. It is not modified.
+            height_ratio: Determines fraction of rows to keep
+            sub_sample: Scaling factor for image
+            reduce_to: Band of rows to keep, see cropSlices()
+            out: Optional float64 buffer of the cropped band's shape, reused
+            across calls to hold the cleaned band. Returned as is when
+            sub_sample is 1.
+            method: Downsampling backend, defaults to the Camera's
+            downsample_method: 'rescale' (skimage, anti-aliased, spreads NaNs),
+            'block_mean' or 'block_min' (NaN-aware blocks of the closest
+            integer size) or 'area' (NaN-aware area averaging)
+            counts: Also return the number of valid pixels that went into
+            each output cell
+            plan: Optional FramePlan (Algorithms/frame_plan.py). Its
+            height_ratio, sub_sample and reduce_to are used instead of the
+            arguments, and the crop borders and out buffer are cached in it.
+        """
+        if plan is not None:
+            height_ratio = plan.height_ratio
+            sub_sample = plan.sub_sample
+            reduce_to = plan.reduce_to
+
+        if (height_ratio > 1.0) or (height_ratio < 0.0)\
+            or (sub_sample > 1.0) or (sub_sample < 0.0):
+            print('height_ratio and sub_sample must be between 0 and 1')
+            exit(1)
 
-        d_short[d_short <= 0] = np.nan
-        d_short[d_short > self.max_depth] = np.nan
-        
-        rescaled = rescale(d_short, sub_sample, mode='reflect', multichannel=False, anti_aliasing=True)
+        # a view, nothing outside the kept rows is touched
+        if plan is not None and plan.crop is not None \
+            and plan.crop[0] == depth.shape:
+            rows, cols = plan.crop[1:]
+        else:
+            rows, cols = self.cropSlices(depth.shape, height_ratio, reduce_to)
+            if plan is not None:
+                plan.crop = (depth.shape, rows, cols)
+        d_view = depth[rows, cols]
+
+        if out is None and plan is not None:
+            out = plan.crop_out
+        if out is None or out.shape != d_view.shape:
+            out = np.empty(d_view.shape)
+            if plan is not None:
+                plan.crop_out = out
+
+        if depth.dtype.kind in 'ui':
+            np.multiply(d_view, self.depth_scale, out = out)
+        else:
+            np.copyto(out, d_view)
+
+        # single validity pass over the kept rows, NaN stays invalid
+        with np.errstate(invalid = 'ignore'):
+            invalid = ~((out > 0) & (out <= self.max_depth))
+        out[invalid] = np.nan
+
+        if method is None:
+            method = self.downsample_method
+
+        if sub_sample == 1:
+            if counts:
+                return out, (~invalid).astype(np.int64)
+            return out
+
+        if method == 'rescale':
+            rescaled = rescale(out, sub_sample, mode='reflect', multichannel=False, anti_aliasing=True)
+            if counts:
+                return rescaled, areaMean(out, sub_sample)[1]
+            return rescaled
+
+        rescaled, valid = downsample(out, sub_sample, method)
+        if counts:
+            return rescaled, valid
 
         return rescaled
 
@@ -164,7 +683,7 @@ def main():
 
     cam = Camera(max_depth = max_depth)
     cam.connect()
-    time.sleep(2.5)
+    cam.waitUntilReady()
 
     t1 = time.time()
     d = cam.getFrames(numFrames)
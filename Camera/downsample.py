@@ -0,0 +1,124 @@
+'''
+Description: NaN-aware downsampling backends for Camera.reduceFrame. Each
+backend returns the reduced depth matrix and the number of valid input
+pixels that went into every output cell.
+'''
+
+import numpy as np
+
+def blockFactor(sub_sample):
+    '''
+    Integer block size closest to a sub_sample scaling factor
+    '''
+    return max(1, int(round(1.0 / sub_sample)))
+
+def _blocks(depth, factor):
+    """
+    Views depth as (rows, factor, columns, factor) blocks, dropping the
+    rows and columns that do not fill a whole block
+    """
+    h = (depth.shape[0] // factor) * factor
+    w = (depth.shape[1] // factor) * factor
+    return depth[:h, :w].reshape(h // factor, factor, w // factor, factor)
+
+def blockMean(depth, factor):
+    '''
+    Averages the valid pixels of each factor x factor block.
+
+    Args:
+        depth: Depth matrix, NaN marks invalid pixels
+        factor: Integer block size
+
+    Returns:
+        matrix: Block means, NaN where a block has no valid pixel
+
+        matrix: Number of valid pixels in each block
+    '''
+    blocks = _blocks(depth, factor)
+    counts = np.count_nonzero(~np.isnan(blocks), axis = (1, 3))
+    total = np.nansum(blocks, axis = (1, 3))
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        return total / counts, counts
+
+def blockMin(depth, factor):
+    '''
+    Takes the closest valid depth of each factor x factor block, which
+    never makes an obstacle look further away than it is.
+
+    Args:
+        depth: Depth matrix, NaN marks invalid pixels
+        factor: Integer block size
+
+    Returns:
+        matrix: Block minimums, NaN where a block has no valid pixel
+
+        matrix: Number of valid pixels in each block
+    '''
+    blocks = _blocks(depth, factor)
+    counts = np.count_nonzero(~np.isnan(blocks), axis = (1, 3))
+    # fmin ignores NaN unless both operands are NaN
+    closest = np.fmin.reduce(np.fmin.reduce(blocks, axis = 3), axis = 1)
+    return closest, counts
+
+def _areaWeights(n_in, n_out):
+    """
+    (n_out, n_in) matrix with the overlap of every output cell with every
+    input pixel along one axis, in input pixels
+    """
+    edges = np.arange(n_out + 1) * (float(n_in) / n_out)
+    left = np.arange(n_in)
+    overlap = np.minimum(edges[1:, None], left[None, :] + 1) \
+        - np.maximum(edges[:-1, None], left[None, :])
+    return np.clip(overlap, 0, None)
+
+def areaMean(depth, sub_sample):
+    '''
+    Resizes by area averaging over the valid pixels, for any (also non
+    integer) scaling factor. The output has the shape skimage's rescale
+    would give.
+
+    Args:
+        depth: Depth matrix, NaN marks invalid pixels
+        sub_sample: Scaling factor
+
+    Returns:
+        matrix: Area weighted means, NaN where a cell covers no valid pixel
+
+        matrix: Valid area (in input pixels) covered by each cell
+    '''
+    h, w = depth.shape
+    out_h = max(1, int(round(h * sub_sample)))
+    out_w = max(1, int(round(w * sub_sample)))
+    rows = _areaWeights(h, out_h)
+    cols = _areaWeights(w, out_w)
+
+    valid = ~np.isnan(depth)
+    total = rows.dot(np.where(valid, depth, 0)).dot(cols.T)
+    counts = rows.dot(valid.astype(np.float64)).dot(cols.T)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        mean = total / counts
+    mean[counts < 1e-9] = np.nan
+    return mean, counts
+
+def downsample(depth, sub_sample, method = 'block_mean'):
+    '''
+    Downsamples a depth matrix with one of the NaN-aware backends.
+
+    Args:
+        depth: Depth matrix, NaN marks invalid pixels
+        sub_sample: Scaling factor, the block backends use the closest
+        integer block size (e.g. 0.3 gives 3 x 3 blocks)
+        method: 'block_mean', 'block_min' or 'area'
+
+    Returns:
+        matrix: Downsampled depth matrix
+
+        matrix: Valid pixels per output cell
+    '''
+    if method == 'block_mean':
+        return blockMean(depth, blockFactor(sub_sample))
+    elif method == 'block_min':
+        return blockMin(depth, blockFactor(sub_sample))
+    elif method == 'area':
+        return areaMean(depth, sub_sample)
+    raise ValueError('unknown downsampling method: {0}'.format(method))
@@ -0,0 +1,199 @@
+'''
+Description: Fixed-capacity ring buffer used to average depth frames
+without reallocating the frame stack on every capture.
+'''
+
+import numpy as np
+
+class FrameBuffer:
+    """
+    Preallocated ring buffer of depth frames
+    """
+    def __init__(self, capacity, shape, dtype = np.float64):
+        """
+        Allocates the frame stack once.
+
+        Args:
+            capacity: Maximum number of frames held by the buffer
+            shape: Shape (height, width) of a single frame
+            dtype: Data type of the stored frames
+        """
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+
+        self.capacity = capacity
+        self.shape = tuple(shape)
+        self.frames = np.empty((capacity,) + self.shape, dtype = dtype)
+        self.stamps = np.zeros(capacity)
+        self.head = 0
+        self.count = 0
+
+    def clear(self):
+        """
+        Forgets all stored frames, the memory is kept for reuse
+        """
+        self.head = 0
+        self.count = 0
+
+    def push(self, frame, scale = None, stamp = 0.0):
+        """
+        Writes a frame into the next slot in place, overwriting the oldest
+        frame once the buffer is full. Pixels <= 0 are the sensor's invalid
+        readings and are stored as NaN so that they do not drag the average
+        down. Integer buffers (raw sensor units) keep 0 as the invalid
+        value.
+
+        Args:
+            frame: Frame to store, must have the buffer's shape
+            scale: Optional factor applied while copying (e.g. depth_scale
+            to convert raw sensor units to meters)
+            stamp: Capture time of the frame
+
+        Returns:
+            The slot the frame was written to (a view into the buffer)
+        """
+        slot = self.frames[self.head]
+        if scale is None:
+            np.copyto(slot, frame, casting = 'unsafe')
+        else:
+            np.multiply(frame, scale, out = slot, casting = 'unsafe')
+
+        if slot.dtype.kind == 'f':
+            slot[slot <= 0] = np.nan
+
+        self.stamps[self.head] = stamp
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+        return slot
+
+    def newest(self):
+        """
+        Returns a view of the most recently written frame
+        """
+        if self.count == 0:
+            return None
+        return self.frames[(self.head - 1) % self.capacity]
+
+    def newestStamp(self):
+        """
+        Returns the capture time of the most recently written frame
+        """
+        if self.count == 0:
+            return None
+        return self.stamps[(self.head - 1) % self.capacity]
+
+    def closest(self, stamp):
+        """
+        Returns how many frames older than the newest one the stored frame
+        captured closest to stamp is (0 for the newest frame)
+        """
+        if self.count == 0:
+            return None
+        order = (self.head - 1 - np.arange(self.count)) % self.capacity
+        return int(np.argmin(np.abs(self.stamps[order] - stamp)))
+
+    def stampAt(self, skip = 0):
+        """
+        Returns the capture time of the frame skip frames older than the
+        newest one
+        """
+        return self.stamps[(self.head - 1 - skip) % self.capacity]
+
+    def _segments(self, n, skip = 0):
+        """
+        Returns n frames, ending skip frames before the newest one, as at
+        most two contiguous views of the stack (two when the window wraps
+        around the end of the buffer).
+        """
+        end = self.head - skip
+        start = end - n
+        if start >= 0:
+            return [self.frames[start:end]]
+        if end <= 0:
+            return [self.frames[start % self.capacity:(end - 1) % self.capacity + 1]]
+        return [self.frames[start % self.capacity:], self.frames[:end]]
+
+    def reduce(self, n = None, method = 'mean', sigma = 2.5, skip = 0):
+        """
+        Reduces the newest n frames to a single frame.
+
+        Args:
+            n: Number of frames to reduce, defaults to all stored frames
+            method: 'mean' (NaN-aware mean), 'median' (NaN-aware median),
+            or 'sigma_clip' (mean after dropping samples further than
+            sigma standard deviations from the per-pixel median)
+            sigma: Clipping threshold used by 'sigma_clip'
+            skip: Number of newest frames to leave out, the reduced frames
+            end skip frames before the newest one
+
+        Returns:
+            matrix: Reduced frame, NaN where no frame had a valid reading.
+            Integer buffers reduce to the buffer's dtype, with 0 where no
+            frame had a valid reading.
+        """
+        if n is None:
+            n = self.count - skip
+        if n < 1 or n + skip > self.count:
+            raise ValueError('cannot reduce {0} frames, buffer holds {1}'.format(n + skip, self.count))
+
+        segments = self._segments(n, skip)
+        raw = self.frames.dtype.kind in 'ui'
+
+        if n == 1:
+            if raw:
+                return segments[-1][-1].copy()
+            return segments[-1][-1].astype(np.float64)
+
+        if method == 'mean':
+            # sum and count each contiguous segment, no stack copy needed
+            if raw:
+                total = np.zeros(self.shape, dtype = np.uint32)
+                valid = np.zeros(self.shape, dtype = np.uint32)
+                for seg in segments:
+                    total += seg.sum(axis = 0, dtype = np.uint32)
+                    valid += np.count_nonzero(seg, axis = 0).astype(np.uint32)
+                # rounded integer mean over the non-zero readings
+                mean = (total + valid // 2) // np.maximum(valid, 1)
+                return mean.astype(self.frames.dtype)
+
+            total = np.zeros(self.shape)
+            valid = np.zeros(self.shape)
+            for seg in segments:
+                total += np.nansum(seg, axis = 0)
+                valid += np.count_nonzero(~np.isnan(seg), axis = 0)
+            with np.errstate(invalid = 'ignore', divide = 'ignore'):
+                return total / valid
+
+        # median based reductions need the whole window at once
+        if len(segments) == 1:
+            window = segments[0]
+        else:
+            window = np.concatenate(segments)
+
+        if raw:
+            window = np.where(window > 0, window, np.nan).astype(np.float32)
+            reduced = self._reduceWindow(window, method, sigma)
+            reduced[np.isnan(reduced)] = 0
+            return np.round(reduced).astype(self.frames.dtype)
+
+        return self._reduceWindow(window, method, sigma)
+
+    def _reduceWindow(self, window, method, sigma):
+        """
+        Median based reductions of a (frames, height, width) stack with NaN
+        marking invalid readings
+        """
+        if method == 'median':
+            return np.nanmedian(window, axis = 0)
+
+        elif method == 'sigma_clip':
+            med = np.nanmedian(window, axis = 0)
+            std = np.nanstd(window, axis = 0)
+            keep = np.abs(window - med) <= sigma * std
+            total = np.where(keep, window, 0).sum(axis = 0)
+            valid = np.count_nonzero(keep, axis = 0)
+            with np.errstate(invalid = 'ignore', divide = 'ignore'):
+                return total / valid
+
+        raise ValueError('unknown reduce method: {0}'.format(method))
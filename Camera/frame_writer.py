@@ -0,0 +1,171 @@
+'''
+Description: Writes recorded frames to disk on a dedicated thread so that
+saving never blocks frame acquisition.
+'''
+
+import numpy as np
+import logging
+import threading
+import os
+from os import path
+from recording import RecordingWriter
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+class FrameWriter:
+    """
+    Background writer fed by a bounded queue of frames
+    """
+    def __init__(self, data_dir, max_queue = 32, drop_policy = 'newest', \
+        container = False, depth_scale = 0.001):
+        """
+        Initializes FrameWriter object, call start() before writing
+
+        Args:
+            data_dir: Directory the .npy files are written to
+            max_queue: Maximum number of frames waiting to be written
+            drop_policy: What happens when the queue is full: 'newest'
+            drops the incoming frame, 'oldest' drops the oldest queued
+            frame to make room, 'block' waits until there is room
+            container: Append the frames to a chunked recording (see
+            recording.py) instead of writing one .npy file per frame. Every
+            start() creates a new recording directory in data_dir.
+            depth_scale: Meters per raw depth unit, stored with a recording
+        """
+        if drop_policy not in ('newest', 'oldest', 'block'):
+            raise ValueError('unknown drop_policy: {0}'.format(drop_policy))
+
+        self.data_dir = data_dir
+        self.container = container
+        self.depth_scale = depth_scale
+        self.recording = None
+        self.recording_path = None
+        self.drop_policy = drop_policy
+        self.queue = queue.Queue(maxsize = max_queue)
+        self.written = 0
+        self.dropped = 0
+        self.thread = None
+
+    def start(self):
+        """
+        Starts the writer thread. In container mode the recording directory
+        is created here, so a data_dir that cannot be written to raises
+        right away instead of every frame being dropped.
+        """
+        if self.thread is not None:
+            return
+        if self.container:
+            self.recording_path = self._newRecording()
+        self.thread = threading.Thread(target = self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """
+        Writes out all queued frames and stops the writer thread
+        """
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        if self.recording is not None:
+            self.recording.close()
+            self.recording = None
+        logging.info("frame_writer.py: {0} frames written, {1} dropped".format(\
+            self.written, self.dropped))
+
+    def write(self, stamp, depth, col = None):
+        """
+        Queues a frame for writing. The arrays are copied, so the caller may
+        reuse them right away.
+
+        Args:
+            stamp: Capture time of the frame, used as the file name
+            depth: Depth matrix
+            col: Color image, optional
+
+        Returns:
+            True if the frame was queued, False if it was dropped
+        """
+        item = (stamp, np.array(depth), None if col is None else np.array(col))
+
+        if self.drop_policy == 'block':
+            self.queue.put(item)
+            return True
+
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return True
+            except queue.Full:
+                if self.drop_policy == 'newest':
+                    self.dropped += 1
+                    return False
+            # 'oldest': evict one queued frame and retry
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+
+    def counters(self):
+        """
+        Returns a dict with the number of written, dropped and queued frames
+        """
+        return {'written': self.written, 'dropped': self.dropped, \
+            'queued': self.queue.qsize()}
+
+    def _run(self):
+        """
+        Body of the writer thread
+        """
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            stamp, depth, col = item
+            try:
+                if self.container:
+                    self._append(stamp, depth, col)
+                else:
+                    np.save(path.join(self.data_dir, str(stamp) + "_d"), depth)
+                    if col is not None:
+                        np.save(path.join(self.data_dir, str(stamp) + "_c"), col)
+                self.written += 1
+            except Exception as error:
+                logging.error("frame_writer.py: " + str(error))
+                self.dropped += 1
+
+    def _newRecording(self):
+        """
+        Creates a new, empty recording directory in data_dir. data_dir is
+        named by the minute, so a camera restarted within the same minute
+        gets recording_1, recording_2, ...
+        """
+        if not path.isdir(self.data_dir):
+            os.makedirs(self.data_dir)
+        n = 0
+        while True:
+            name = 'recording' if n == 0 else 'recording_{0}'.format(n)
+            try:
+                os.mkdir(path.join(self.data_dir, name))
+                return path.join(self.data_dir, name)
+            except OSError:
+                if not path.exists(path.join(self.data_dir, name)):
+                    raise
+            n += 1
+
+    def _append(self, stamp, depth, col):
+        """
+        Appends a frame to the recording, creating it from the first frame
+        """
+        if self.recording is None:
+            self.recording = RecordingWriter(self.recording_path, \
+                depth.shape, depth_dtype = depth.dtype, color = col is not None, \
+                depth_scale = self.depth_scale)
+        self.recording.append(stamp, depth, col)
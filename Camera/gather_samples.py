@@ -22,7 +22,7 @@ def getSamples(max_depth=6.0, numFrames=5):
     # get frames
     cam = camera.Camera(max_depth = max_depth)
     cam.connect()
-    time.sleep(2.5)
+    cam.waitUntilReady()
 
     t1 = time.time()
     d, c = cam.getFrames(numFrames, rgb=True)
@@ -0,0 +1,149 @@
+'''
+Description: Captures from several R200 cameras in parallel and hands out
+time-aligned sets of their frames.
+'''
+
+import numpy as np
+import logging
+import time
+from multiprocessing.pool import ThreadPool
+from camera import Camera
+
+try:
+    import pyrealsense as pyrs
+except ImportError as error:
+    # replayed cameras do not need the sensor library
+    pyrs = None
+    logging.warning("multi_camera.py: " + str(error))
+
+class CameraGroup:
+    """
+    Several cameras behind one capture manager, one capture thread per
+    device
+    """
+    def __init__(self, device_ids = (0,), camera = Camera, **kwargs):
+        """
+        Initializes CameraGroup object
+
+        Args:
+            device_ids: Indices of the R200s to use
+            camera: Camera class (e.g. ReplayCamera) or function creating
+            one, called with device_id and kwargs
+            kwargs: Passed on to every Camera (e.g. max_depth)
+        """
+        self.cameras = [camera(device_id = i, **kwargs) for i in device_ids]
+        self.pool = None
+        self.serv = None
+
+    def connect(self, rgb = False):
+        """
+        Connects all cameras through one pyrealsense Service (if the
+        library is available) and starts their background capture threads
+
+        Args:
+            rgb: Also capture color images
+        """
+        if pyrs is not None:
+            self.serv = pyrs.Service()
+        for cam in self.cameras:
+            cam.connect(serv = self.serv)
+        for cam in self.cameras:
+            cam.startCapture(rgb = rgb)
+        self.pool = ThreadPool(len(self.cameras))
+
+    def disconnect(self):
+        """
+        Stops capturing and disconnects all cameras
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+        for cam in self.cameras:
+            cam.disconnect()
+        if self.serv is not None:
+            self.serv.stop()
+            self.serv = None
+
+    def waitUntilReady(self, timeout = 5.0):
+        """
+        Waits until every camera is stable, see Camera.waitUntilReady()
+        """
+        t_start = time.time()
+        ready = True
+        for cam in self.cameras:
+            remaining = max(0.0, timeout - (time.time() - t_start))
+            ready = cam.waitUntilReady(timeout = remaining) and ready
+        return ready
+
+    def getFrames(self, frames = 5, rgb = False, method = None, timeout = 1.0):
+        """
+        Returns a time-aligned set of averaged depth frames, one per camera.
+        The set is aligned to the newest moment every camera has a frame
+        for, each camera contributing the frames captured closest to it.
+
+        Args:
+            frames: Number of depth frames to average per camera
+            rgb: Also return the newest color image of every camera, needs
+            connect(rgb = True)
+            method: Reduction used to average the frames
+            timeout: Seconds to wait for every camera's first frame
+
+        Returns:
+            list: Depth matrices in the order of device_ids
+
+            (list: Color images if rgb is True)
+
+            array: Capture time of the newest frame used of every camera
+
+            float: Skew, the largest difference between those capture times
+        """
+        deadline = time.time() + timeout
+        latest = [cam.latestStamp() for cam in self.cameras]
+        while None in latest:
+            if time.time() > deadline:
+                raise RuntimeError('not every camera delivered a frame')
+            time.sleep(0.005)
+            latest = [cam.latestStamp() for cam in self.cameras]
+
+        reference = min(latest)
+        results = self.pool.map(lambda cam: cam.getFramesAt(reference, frames, method), \
+            self.cameras)
+
+        depths = [depth for depth, _ in results]
+        stamps = np.array([stamp for _, stamp in results])
+        skew = stamps.max() - stamps.min()
+
+        if rgb:
+            colors = [cam.color for cam in self.cameras]
+            return depths, colors, stamps, skew
+
+        return depths, stamps, skew
+
+def main():
+    """
+    Reports capture latency and skew of two cameras, or of two replays of
+    a recording given as argument
+    """
+    import sys
+    from replay_camera import ReplayCamera
+
+    numFrames = 5
+    if len(sys.argv) > 1:
+        group = CameraGroup(device_ids = (0, 1), camera = ReplayCamera, \
+            source = sys.argv[1], max_depth = 4.0)
+    else:
+        group = CameraGroup(device_ids = (0, 1), max_depth = 4.0)
+    group.connect()
+    group.waitUntilReady()
+
+    for _ in range(10):
+        t1 = time.time()
+        depths, stamps, skew = group.getFrames(numFrames)
+        t2 = time.time()
+        print('Time to get {0} aligned frame sets: {1}, skew: {2}'.format(\
+            len(depths), t2 - t1, skew))
+
+    group.disconnect()
+
+if __name__ == "__main__":
+    main()
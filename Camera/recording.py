@@ -0,0 +1,206 @@
+'''
+Description: Chunked recording container for depth and color streams.
+
+A recording is a directory holding
+    meta.json           frame shapes, dtypes, chunk size and depth scale
+    index.bin           one (stamp, chunk, offset) record per frame
+    depth_<n>.npy       preallocated chunks of chunk_size depth frames
+    color_<n>.npy       preallocated chunks of chunk_size color frames
+Chunks are .npy files so they can be memory-mapped with np.load.
+'''
+
+import numpy as np
+import json
+import os
+
+INDEX_DTYPE = np.dtype([('stamp', '<f8'), ('chunk', '<u4'), ('offset', '<u4')])
+
+def isRecording(path):
+    '''
+    Returns True if path is a recording directory
+    '''
+    return os.path.isfile(os.path.join(path, 'meta.json'))
+
+class RecordingWriter:
+    """
+    Appends frames to a recording
+    """
+    def __init__(self, path, shape, depth_dtype = np.uint16, color = True, \
+        chunk_size = 256, depth_scale = 0.001):
+        """
+        Creates the recording directory
+
+        Args:
+            path: Directory of the recording, must not be a recording yet
+            shape: Shape (height, width) of the depth frames
+            depth_dtype: uint16 for raw sensor units, float for meters
+            color: Also record (height, width, 3) uint8 color frames
+            chunk_size: Number of frames preallocated per chunk file
+            depth_scale: Meters per raw depth unit
+        """
+        if isRecording(path):
+            raise ValueError('{0} already holds a recording'.format(path))
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        self.path = path
+        self.shape = tuple(shape)
+        self.depth_dtype = np.dtype(depth_dtype)
+        self.color = color
+        self.chunk_size = chunk_size
+        self.count = 0
+        self.depth_chunk = None
+        self.color_chunk = None
+
+        meta = {'shape': list(self.shape), 'depth_dtype': self.depth_dtype.str, \
+            'color': color, 'chunk_size': chunk_size, 'depth_scale': depth_scale}
+        with open(os.path.join(path, 'meta.json'), 'w') as file:
+            json.dump(meta, file, indent = 4)
+        self.index = open(os.path.join(path, 'index.bin'), 'ab')
+
+    def _openChunk(self, chunk):
+        """
+        Preallocates the chunk files a new frame goes into
+        """
+        self.flush()
+        self.depth_chunk = np.lib.format.open_memmap(\
+            os.path.join(self.path, 'depth_{0:04d}.npy'.format(chunk)), mode = 'w+', \
+            dtype = self.depth_dtype, shape = (self.chunk_size,) + self.shape)
+        if self.color:
+            self.color_chunk = np.lib.format.open_memmap(\
+                os.path.join(self.path, 'color_{0:04d}.npy'.format(chunk)), mode = 'w+', \
+                dtype = np.uint8, shape = (self.chunk_size,) + self.shape + (3,))
+
+    def append(self, stamp, depth, col = None):
+        """
+        Appends a frame to the recording
+
+        Args:
+            stamp: Capture time of the frame
+            depth: Depth matrix of the recording's shape
+            col: Color image, required if the recording has color
+        """
+        chunk, offset = divmod(self.count, self.chunk_size)
+        if offset == 0:
+            self._openChunk(chunk)
+
+        self.depth_chunk[offset] = depth
+        if self.color:
+            self.color_chunk[offset] = col
+
+        record = np.array([(stamp, chunk, offset)], dtype = INDEX_DTYPE)
+        self.index.write(record.tobytes())
+        self.count += 1
+
+    def flush(self):
+        """
+        Pushes written frames to disk
+        """
+        if self.depth_chunk is not None:
+            self.depth_chunk.flush()
+        if self.color_chunk is not None:
+            self.color_chunk.flush()
+        self.index.flush()
+
+    def close(self):
+        """
+        Flushes and closes the recording
+        """
+        self.flush()
+        self.depth_chunk = None
+        self.color_chunk = None
+        self.index.close()
+
+class _ChunkedFrames:
+    """
+    Read-only sequence of memory-mapped frames spread over chunk files
+    """
+    def __init__(self, chunks, index):
+        self.chunks = chunks
+        self.index = index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        record = self.index[i]
+        return self.chunks[record['chunk']][record['offset']]
+
+class RecordingReader:
+    """
+    Memory-mapped, random access view of a recording
+    """
+    def __init__(self, path):
+        """
+        Opens a recording, no frame data is read until it is accessed
+
+        Args:
+            path: Directory of the recording
+        """
+        if not isRecording(path):
+            raise ValueError('{0} is not a recording'.format(path))
+
+        with open(os.path.join(path, 'meta.json')) as file:
+            meta = json.load(file)
+
+        self.path = path
+        self.shape = tuple(meta['shape'])
+        self.depth_dtype = np.dtype(meta['depth_dtype'])
+        self.chunk_size = meta['chunk_size']
+        self.depth_scale = meta['depth_scale']
+        self.has_color = meta['color']
+
+        # a frame being appended while we open may be incomplete
+        size = os.path.getsize(os.path.join(path, 'index.bin'))
+        count = size // INDEX_DTYPE.itemsize
+        if count > 0:
+            self.index = np.memmap(os.path.join(path, 'index.bin'), \
+                dtype = INDEX_DTYPE, mode = 'r', shape = (count,))
+        else:
+            self.index = np.zeros(0, dtype = INDEX_DTYPE)
+        self.stamps = self.index['stamp']
+
+        n_chunks = 0 if count == 0 else int(self.index['chunk'].max()) + 1
+        depth_chunks = [np.load(os.path.join(path, 'depth_{0:04d}.npy'.format(i)), \
+            mmap_mode = 'r') for i in range(n_chunks)]
+        self.depths = _ChunkedFrames(depth_chunks, self.index)
+
+        self.colors = None
+        if self.has_color:
+            color_chunks = [np.load(os.path.join(path, 'color_{0:04d}.npy'.format(i)), \
+                mmap_mode = 'r') for i in range(n_chunks)]
+            self.colors = _ChunkedFrames(color_chunks, self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        """
+        Returns (stamp, depth, color) of frame i, depth and color are
+        memory-mapped views (color is None without color)
+        """
+        col = None if self.colors is None else self.colors[i]
+        return self.stamps[i], self.depths[i], col
+
+    def find(self, t_start, t_end = None):
+        """
+        Returns the range of frame numbers captured in [t_start, t_end)
+
+        Args:
+            t_start: First capture time to include
+            t_end: Capture time to stop at, defaults to the end
+        """
+        start = int(np.searchsorted(self.stamps, t_start, side = 'left'))
+        end = len(self)
+        if t_end is not None:
+            end = int(np.searchsorted(self.stamps, t_end, side = 'left'))
+        return range(start, end)
+
+    def frames(self, start = 0, stop = None):
+        """
+        Streams (stamp, depth, color) of frames start to stop in order
+        """
+        if stop is None:
+            stop = len(self)
+        for i in range(start, stop):
+            yield self[i]
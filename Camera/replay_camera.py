@@ -0,0 +1,237 @@
+'''
+Description: Replays recorded depth and color frames through the Camera
+interface, so the full pipeline can run without an R200 attached.
+'''
+
+import numpy as np
+import logging
+import time
+import os
+from camera import Camera
+from recording import isRecording, RecordingReader
+
+def findFrames(source):
+    '''
+    Collects the (depth, color) file pairs of a recording.
+
+    Args:
+        source: Directory of *_d.npy / *_c.npy files (e.g. one of the
+        Camera/Sample_Data directories or a save_images recording), a
+        directory of such directories (e.g. Camera/Sample_Data), or a list
+        of directories
+
+    Returns:
+        list: (depth path, color path or None) tuples, in recording order
+    '''
+    if isinstance(source, (list, tuple)):
+        pairs = []
+        for directory in source:
+            pairs += findFrames(directory)
+        return pairs
+
+    pairs = []
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        frames = {}
+        for file in files:
+            if file.endswith('_d.npy'):
+                frames.setdefault(file[:-len('_d.npy')], [None, None])[0] = file
+            elif file.endswith('_c.npy'):
+                frames.setdefault(file[:-len('_c.npy')], [None, None])[1] = file
+
+        def order(key):
+            # recordings are named by timestamp, sample data by number
+            try:
+                return (0, float(key.split('_')[0]), key)
+            except ValueError:
+                return (1, 0, key)
+
+        for key in sorted(frames, key = order):
+            d, c = frames[key]
+            if d is None:
+                continue
+            pairs.append((os.path.join(root, d), \
+                None if c is None else os.path.join(root, c)))
+
+    return pairs
+
+def _toRaw(depth, depth_scale):
+    '''
+    Converts a depth frame recorded in meters to the sensor's raw units
+    '''
+    if depth.dtype.kind == 'f':
+        return np.round(np.nan_to_num(depth) / depth_scale).astype(np.uint16)
+    return depth
+
+class ReplayDevice:
+    """
+    Stands in for a pyrealsense device, serving recorded frames at a
+    fixed frame rate
+    """
+    def __init__(self, source, fps = 60, realtime = True, loop = True, \
+        depth_scale = 0.001):
+        """
+        Directories of .npy files are loaded into memory so that disk reads
+        do not show up in the timing of the pipeline. Chunked recordings
+        are memory-mapped and streamed.
+
+        Args:
+            source: Chunked recording directory (see recording.py), or
+            directories of .npy files (see findFrames())
+            fps: Frame rate of the replayed stream
+            realtime: Pace wait_for_frames() to fps like the sensor does,
+            otherwise frames are served as fast as they are requested
+            loop: Start over at the end of the recording, otherwise
+            wait_for_frames() raises EOFError
+            depth_scale: Meters per raw depth unit of recordings stored in
+            meters, recordings in raw units bring their own
+        """
+        self.fps = float(fps)
+        self.realtime = realtime
+        self.loop = loop
+        self.depth_scale = depth_scale
+
+        if not isinstance(source, (list, tuple)) and isRecording(source):
+            reader = RecordingReader(source)
+            if reader.depth_dtype.kind != 'f':
+                self.depth_scale = reader.depth_scale
+            self.depths = reader.depths
+            self.colors = reader.colors
+            if self.colors is None:
+                blank = np.zeros(reader.shape + (3,), dtype = np.uint8)
+                self.colors = [blank] * len(reader)
+        else:
+            self.depths = []
+            self.colors = []
+            for d_path, c_path in findFrames(source):
+                # sample data is stored in meters, the sensor gives raw units
+                d = _toRaw(np.load(d_path), depth_scale)
+                self.depths.append(d)
+
+                if c_path is None:
+                    c = np.zeros(d.shape + (3,), dtype = np.uint8)
+                else:
+                    c = np.load(c_path)
+                self.colors.append(c)
+
+        if len(self.depths) == 0:
+            raise ValueError('no recorded frames found')
+
+        self.depth = None
+        self.color = None
+        self.index = -1
+        self.served = 0
+        self.skipped = 0
+        self.start = None
+        self.tick = -1
+
+    def wait_for_frames(self):
+        """
+        Advances to the next frame, waiting for it in realtime mode. Frames
+        that were due while the caller was busy are skipped, as they would
+        be on the sensor.
+        """
+        if not self.realtime:
+            self.tick += 1
+        else:
+            now = time.time()
+            if self.start is None:
+                self.start = now
+            due = int((now - self.start) * self.fps)
+            tick = max(due, self.tick + 1)
+            delay = self.start + tick / self.fps - now
+            if delay > 0:
+                time.sleep(delay)
+            self.skipped += tick - self.tick - 1
+            self.tick = tick
+
+        if self.tick >= len(self.depths) and not self.loop:
+            raise EOFError('end of recording')
+
+        self.index = self.tick % len(self.depths)
+        self.depth = _toRaw(self.depths[self.index], self.depth_scale)
+        self.color = self.colors[self.index]
+        self.served += 1
+
+    def stop(self):
+        pass
+
+class ReplayCamera(Camera):
+    """
+    Camera that streams recorded frames instead of reading the R200
+    """
+    def __init__(self, source = './Camera/Sample_Data', fps = 60, \
+        realtime = True, loop = True, **kwargs):
+        """
+        Initializes ReplayCamera object, takes the same keyword arguments
+        as Camera
+
+        Args:
+            source: Recording to replay, see ReplayDevice
+            fps: Frame rate of the replayed stream
+            realtime: Pace frames to fps, otherwise run as fast as possible
+            loop: Start over at the end of the recording
+        """
+        Camera.__init__(self, **kwargs)
+        self.source = source
+        self.fps = fps
+        self.realtime = realtime
+        self.loop = loop
+
+    def connect(self, serv = None):
+        """
+        Loads the recording
+
+        Args:
+            serv: Ignored, accepted so that replays can stand in for cameras
+            sharing a pyrealsense Service (see CameraGroup)
+        """
+        logging.info("replay_camera.py: replaying " + str(self.source))
+        self.dev = ReplayDevice(self.source, fps = self.fps, \
+            realtime = self.realtime, loop = self.loop)
+        self.depth_scale = self.dev.depth_scale
+
+    def disconnect(self):
+        """
+        Stops replaying
+        """
+        self.stopCapture()
+        if self.writer is not None:
+            self.writer.stop()
+        logging.info("replay_camera.py: {0} frames served, {1} skipped".format(\
+            self.dev.served, self.dev.skipped))
+
+    def __str__(self):
+        return 'ReplayCamera({0}, fps = {1})'.format(self.source, self.fps)
+
+def main():
+    """
+    Measures how fast frames can be pulled through the Camera interface
+    """
+    import sys
+
+    source = './Sample_Data'
+    if len(sys.argv) > 1:
+        source = sys.argv[1]
+    numFrames = 5
+    iterations = 100
+
+    cam = ReplayCamera(source, fps = 60, realtime = True, max_depth = 4.0)
+    cam.connect()
+
+    times = []
+    for _ in range(iterations):
+        t1 = time.time()
+        d = cam.getFrames(numFrames)
+        d_small = cam.reduceFrame(d)
+        times.append(time.time() - t1)
+    cam.disconnect()
+
+    times = np.array(times)
+    print('Frames per call: {0}'.format(numFrames))
+    print('Calls per second: {0}'.format(len(times) / times.sum()))
+    print('p50 / p95 / p99 latency: {0} / {1} / {2}'.format(\
+        *np.percentile(times, [50, 95, 99])))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+'''
+Description: Lightweight per-frame latency instrumentation for the
+capture-to-command path.
+'''
+
+import time
+import json
+import atexit
+import numpy as np
+
+class LatencyTracker:
+    """
+    Keeps rolling per-stage latencies of the frames going through the
+    pipeline
+    """
+    def __init__(self, window = 500):
+        """
+        Initializes LatencyTracker object
+
+        Args:
+            window: Number of most recent frames the percentiles cover
+        """
+        self.window = window
+        self.stages = []
+        self.samples = {}
+        self.counts = {}
+        self.frame_start = None
+        self.last = None
+
+    def record(self, stage, seconds):
+        """
+        Adds one measurement to the rolling window of a stage, for
+        durations measured outside of begin() / stamp()
+        """
+        if stage not in self.samples:
+            self.stages.append(stage)
+            self.samples[stage] = np.zeros(self.window)
+            self.counts[stage] = 0
+        self.samples[stage][self.counts[stage] % self.window] = seconds
+        self.counts[stage] += 1
+
+    def begin(self, sensor_time = None):
+        '''
+        Starts timing a frame.
+
+        Args:
+            sensor_time: Time the frame arrived from the sensor (e.g. the
+            stamp returned by Camera.getFrames(stamped = True)), defaults
+            to now. The wait until processing starts is recorded as stage
+            'sensor'.
+        '''
+        now = time.time()
+        if sensor_time is None:
+            sensor_time = now
+        self.frame_start = sensor_time
+        self.last = now
+        self.record('sensor', now - sensor_time)
+
+    def stamp(self, stage):
+        '''
+        Records the time since the previous stamp (or begin) as the
+        duration of a stage.
+
+        Args:
+            stage: Name of the stage that just finished
+        '''
+        if self.frame_start is None:
+            return
+        now = time.time()
+        self.record(stage, now - self.last)
+        self.last = now
+
+    def end(self):
+        '''
+        Finishes the frame, recording its age at decision time (sensor
+        arrival to now) as 'frame_age'.
+        '''
+        if self.frame_start is None:
+            return
+        self.record('frame_age', time.time() - self.frame_start)
+        self.frame_start = None
+
+    def snapshot(self):
+        '''
+        Returns a dict of stage -> {count, last, mean, p50, p95, p99} with
+        latencies in milliseconds, stages in the order first seen
+        '''
+        snap = {}
+        for stage in self.stages:
+            n = min(self.counts[stage], self.window)
+            values = self.samples[stage][:n] * 1000.0
+            last = self.samples[stage][(self.counts[stage] - 1) % self.window] * 1000.0
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            snap[stage] = {'count': self.counts[stage], 'last': last, \
+                'mean': values.mean(), 'p50': p50, 'p95': p95, 'p99': p99}
+        return snap
+
+    def report(self):
+        '''
+        Returns the snapshot as a printable table
+        '''
+        snap = self.snapshot()
+        lines = ['{0:<16}{1:>8}{2:>10}{3:>10}{4:>10}{5:>10}'.format(\
+            'stage (ms)', 'count', 'last', 'p50', 'p95', 'p99')]
+        for stage in self.stages:
+            s = snap[stage]
+            lines.append('{0:<16}{1:>8}{2:>10.2f}{3:>10.2f}{4:>10.2f}{5:>10.2f}'.format(\
+                stage, s['count'], s['last'], s['p50'], s['p95'], s['p99']))
+        return '\n'.join(lines)
+
+    def dump(self, file_path = None):
+        '''
+        Prints the report and optionally saves the snapshot as .json
+
+        Args:
+            file_path: .json file to write, nothing is written if None
+        '''
+        if len(self.stages) == 0:
+            return
+        print(self.report())
+        if file_path is not None:
+            with open(file_path, 'w') as file:
+                json.dump(self.snapshot(), file, indent = 4)
+
+    def dumpOnExit(self, file_path = None):
+        '''
+        Dumps the latencies when the program exits (see dump())
+        '''
+        atexit.register(self.dump, file_path)
@@ -6,11 +6,13 @@ Description: Module to test the ODA algorithm and targeted landing.
 from Camera import camera
 from Algorithms import create_samples as cs
 from Algorithms import discretize as disc
-from Algorithms import voronoi as voronoi
+from Algorithms import backends
 from Algorithms import gap_detection as gd
+from Algorithms.frame_plan import FramePlan
 from process_frames import plot2
 from Drone_Control import mission_move_drone as md
 from process_frames import getFramesFromSource
+from latency import LatencyTracker
 
 import matplotlib.pyplot as plt
 import time
@@ -41,36 +43,42 @@ def send_ned_velocity(vehicle, velocity_x, velocity_y, velocity_z, duration):
         vehicle.send_mavlink(msg)
         time.sleep(1)
 
-def avoidObs(cam, numFrames, height_ratio, sub_sample, reduce_to, perc_samples, iters, min_dist):
+def avoidObs(cam, numFrames, height_ratio, sub_sample, reduce_to, perc_samples, iters, min_dist, plan=None, timer=None, backend='nearest'):
     print('COMMAND: Get drone\'s displacement from target.')
     print('\tIf close to target, land and return. If not, continue.')
-    # d = cam.getFrames(numFrames, rgb=False)
 
     # source = './Camera/Sample_Data/two_boxes'
     # d, c = getFramesFromSource(source)
 
-    # generate representative depth matrix
-    h = 12
-    w = 16
-    d = 6.0 * np.random.rand(h, w)
-
-    t1 = time.time()
-
-    d_small = cam.reduceFrame(d, height_ratio = height_ratio, sub_sample = sub_sample, reduce_to = reduce_to)
-
-    samples, measured_vector = cs.createSamples(d_small, perc_samples)
-    try:
-        v = voronoi.getVoronoi(d_small.shape, samples, measured_vector)
-    except:
-        v = d_small
+    if cam.dev is not None:
+        # newest frames of the background capture, stamped at sensor arrival
+        d, sensor_time, age = cam.getFrames(numFrames, rgb=False, stamped=True)
+    else:
+        # no camera, generate representative depth matrix
+        h = 12
+        w = 16
+        d = 6.0 * np.random.rand(h, w)
+        sensor_time = time.time()
+
+    if timer is None:
+        timer = LatencyTracker()
+    timer.begin(sensor_time)
+
+    d_small = cam.reduceFrame(d, height_ratio = height_ratio, sub_sample = sub_sample, reduce_to = reduce_to, plan = plan)
+    timer.stamp('reduceFrame')
+
+    samples, measured_vector = cs.createSamples(d_small, perc_samples, plan = plan)
+    timer.stamp('createSamples')
+    v, confidence = backends.complete(backend, d_small, plan, samples, measured_vector)
+    timer.stamp('interpolation')
     d = disc.depthCompletion(v, iters)
+    timer.stamp('depthCompletion')
 
     x = gd.findLargestGap(d, min_dist)
+    timer.stamp('findLargestGap')
 
-    t2 = time.time()
     print('COMMAND: Rotate drone to face target.')
     print('COMMAND: Get depth data from R200.')
-    print('time to do gap detection: {0}'.format(t2 - t1))
 
     if x == None:
         x = len(d[0]) // 2
@@ -82,6 +90,8 @@ def avoidObs(cam, numFrames, height_ratio, sub_sample, reduce_to, perc_samples,
         print('COMMAND: Move forward.\n')
     else:
         print('COMMAND: Rotate drone {0} degrees and move forward until obstacle is cleared.\n'.format(delTheta))
+    timer.stamp('command')
+    timer.end()
 
     plt.figure()
     plt.subplot(1, 2, 1)
@@ -107,12 +117,14 @@ def main():
     cam = camera.Camera(max_depth=max_depth)
     try:
         cam.connect()
+        cam.waitUntilReady()
+        # keep pulling frames while the ODA computation runs
+        cam.startCapture(rgb = False)
         print('Connected to R200 camera')
     except:
         print('Cannot connect to camera')
         pass
     source = cam
-    time.sleep(2.5)
     
     numFrames = 5
     # height_ratio of 1 keeps all rows of original image
@@ -125,6 +137,14 @@ def main():
     perc_samples = 0.05
     iters = 3
     min_dist = 1.0
+    # depth completion backend, see backends.names(). 'nearest' gives the
+    # same image as 'voronoi' from a distance transform, 'voronoi' builds
+    # polygons and is kept for comparisons (thesis.py, process_frames.py)
+    backend = 'nearest'
+    # frames between new random sampling patterns, 0 samples the same
+    # pixels forever (the cached backends rebuild their state on every
+    # new pattern)
+    reshuffle_every = 30
 
     print('Program settings:')
     print('\tsource: ' + str(source))
@@ -136,10 +156,25 @@ def main():
     print('\tperc_samples: ' + str(perc_samples))
     print('\titers: ' + str(iters))
     print('\tmin_dist: ' + str(min_dist))
+    print('\treshuffle_every: ' + str(reshuffle_every))
+    print('\tbackend: ' + str(backends.BACKENDS[backend]))
+
+    # shape dependent work is done once and reused for every frame, the
+    # sampling pattern until the next reshuffle
+    plan = FramePlan(height_ratio = height_ratio, sub_sample = sub_sample, \
+        reduce_to = reduce_to, perc_samples = perc_samples, iters = iters)
+
+    # per-stage latencies, printed on exit
+    timer = LatencyTracker()
+    timer.dumpOnExit()
 
     #########################
+    frame = 0
     while True:
-        avoidObs(cam, numFrames, height_ratio, sub_sample, reduce_to, perc_samples, iters, min_dist)
+        if reshuffle_every and frame > 0 and frame % reshuffle_every == 0:
+            plan.reshuffle()
+        avoidObs(cam, numFrames, height_ratio, sub_sample, reduce_to, perc_samples, iters, min_dist, plan, timer, backend)
+        frame += 1
     
     # ######################### set up drone connection
     # connection_string = 'tcp:127.0.0.1:5760'
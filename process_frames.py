@@ -3,12 +3,12 @@ Author: Mario Liu
 Description: Helper module for retrieving and showing data.
 '''
 
-import time
 import os
 import numpy as np
 import matplotlib.pyplot as plt
+from latency import LatencyTracker
 
-def getFramesFromSource(source, numFrames=5):
+def getFramesFromSource(source, numFrames=5, timer=None):
     '''
     Gets frames from either a data directory or from the camera itself.
 
@@ -16,17 +16,18 @@ def getFramesFromSource(source, numFrames=5):
         source: Can be either a Camera object or a path to a
         directory of .npy files
 
+        timer: Optional LatencyTracker, a frame is started on it with the
+        sensor stamp of the camera frames (or now for files)
+
     Returns:
         One depth matrix and one color matrix
     '''
 
     # assuming source is a Camera object
     try:
-        t1 = time.time()
-        d, c = source.getFrames(numFrames, rgb=True)
-        t2 = time.time()
-        printStmt = 'Time to get {0} frames: ' + str(t2 - t1)
-        print(printStmt.format(numFrames))
+        d, c, stamp, age = source.getFrames(numFrames, rgb=True, stamped=True)
+        if timer is not None:
+            timer.begin(stamp)
 
         return d, c
     except:
@@ -45,6 +46,8 @@ def getFramesFromSource(source, numFrames=5):
             elif 'd.npy' in file:
                 d = frame
 
+        if timer is not None:
+            timer.begin()
         return d, c
     except Exception as e:
         print('Error: ' + str(e))
@@ -94,14 +97,14 @@ def main():
     '''
     import sys
     from Camera import camera
+    from Camera import replay_camera
     from Algorithms import discretize as disc
-    from Algorithms import rbf_interpolation as rbfi
-    from Algorithms import voronoi as voro
+    from Algorithms import backends
     from Algorithms import create_samples as cs
 
     argv = sys.argv
     if len(argv) == 1:
-        print('Usage: python {0} [cam|data]'.format(argv[0]))
+        print('Usage: python {0} [cam|data|replay] [backend ...]'.format(argv[0]))
         exit(1)
 
     max_depth = 6.0
@@ -111,11 +114,17 @@ def main():
         cam.connect()
         source = cam
         print('Connected to R200 camera')
+    elif argv[1] == 'replay':
+        cam = replay_camera.ReplayCamera('./Camera/Sample_Data/random_stuff', \
+            max_depth = max_depth)
+        cam.connect()
+        source = cam
+        print('Replaying recorded frames')
     elif argv[1] == 'data':
         print('Using data directory for frames')
         source = './Camera/Sample_Data/random_stuff'
     else:
-        print('Usage: python {0} [cam|data]'.format(argv[0]))
+        print('Usage: python {0} [cam|data|replay] [backend ...]'.format(argv[0]))
         exit(1)
 
     numFrames = 60
@@ -127,6 +136,8 @@ def main():
     reduce_to = 'middle'
     iters = 2
     perc_samples = 0.01
+    # depth completion backends to compare, see backends.names()
+    names = argv[2:] if len(argv) > 2 else ['local_rbf', 'voronoi']
 
     print('Program settings:')
     print('\tsource: ' + str(source))
@@ -136,14 +147,37 @@ def main():
     print('\tsub_sample: ' + str(sub_sample))
     print('\treduce_to: ' + reduce_to)
     print('\titers: ' + str(iters))
+    print('\tbackends: ' + ', '.join(names))
 
     #######################################################
     # test algorithms and plot
     #######################################################
-    # sleep to make sure camera starts up
-    time.sleep(2.5)
-    d, c = getFramesFromSource(source, numFrames)
+    # make sure camera starts up
+    if source is cam:
+        cam.waitUntilReady()
+    timer = LatencyTracker()
+    d, c = getFramesFromSource(source, numFrames, timer)
     d_small = cam.reduceFrame(d, height_ratio = height_ratio, sub_sample = sub_sample, reduce_to = reduce_to)
+    timer.stamp('reduceFrame')
+
+    # initial discretization
+    recon = disc.depthCompletion(d_small, iters)
+    timer.stamp('depthCompletion')
+
+    # interpolation backends, all on the same samples
+    samples, measured_vector = cs.createSamples(d_small, perc_samples)
+    timer.stamp('createSamples')
+    results = []
+    for name in names:
+        filled, confidence = backends.complete(name, d_small, samples = samples, vec = measured_vector)
+        timer.stamp(name)
+        filled_disc = disc.depthCompletion(filled, iters)
+        timer.stamp(name + ' + disc')
+        results.append((name, filled, filled_disc))
+    timer.end()
+
+    print('')
+    print(timer.report())
 
     # uncomment to plot original image
     fig0 = plt.figure()
@@ -157,55 +191,11 @@ def main():
 
     # regular cropping and resizing
     plot2(figs, d, d_small, 'Original', scaledTitle)
-
-    # initial discretization
-    t1 = time.time()
-    recon = disc.depthCompletion(d_small, iters)
-    t2 = time.time()
-
-    print('Time to do disc: ' + str(t2 - t1))
-    print('')
     plot2(figs, d_small, recon, scaledTitle, 'Discretization')
 
-    # use when rbf fails
-    # raw_input('Press <Enter> to close all plots and exit')
-    # return
-    
-    # radial basis function
-    t1 = time.time()
-    samples, measured_vector = cs.createSamples(d_small, perc_samples)
-    try:
-        rbf = rbfi.interpolate(d_small.shape, samples, measured_vector)
-    except:
-        rbf = d_small
-    t2 = time.time()
-    rbf_disc = disc.depthCompletion(rbf, iters)
-    t3 = time.time()
-
-    print('Time to do RBF: ' + str(t2 - t1))
-    plot2(figs, d_small, rbf, scaledTitle, 'RBF')
-
-    print('Time to do RBF and disc: ' + str(t3 - t1))
-    print('')
-    plot2(figs, d_small, rbf_disc, scaledTitle, 'RBF and disc')
-
-    # Voronoi interpolation
-    t1 = time.time()
-    samples, measured_vector = cs.createSamples(d_small, perc_samples)
-    try:
-        v = voro.getVoronoi(d_small.shape, samples, measured_vector)
-    except:
-        v = d_small
-    t2 = time.time()
-    voro_disc = disc.depthCompletion(v, iters)
-    t3 = time.time()
-
-    print('Time to do Voronoi: ' + str(t2 - t1))
-    plot2(figs, d_small, v, scaledTitle, 'Voronoi')
-
-    print('Time to do Voronoi and disc: ' + str(t3 - t1))
-    print('')
-    plot2(figs, d_small, voro_disc, scaledTitle, 'Voronoi and disc')
+    for name, filled, filled_disc in results:
+        plot2(figs, d_small, filled, scaledTitle, name)
+        plot2(figs, d_small, filled_disc, scaledTitle, name + ' and disc')
 
     # block plots until button is pressed
     raw_input('Press <Enter> to close all plots and exit')
@@ -177,8 +177,8 @@ def scale():
 
 def interp_comp():
     from Algorithms import create_samples
-    from Algorithms import voronoi
-    from Algorithms import rbf_interpolation
+    from Algorithms import backends
+    from latency import LatencyTracker
 
     max_depth = 6.0
     perc_samples = 0.01
@@ -188,27 +188,26 @@ def interp_comp():
     d_small = cam.reduceFrame(d, height_ratio = 1, sub_sample = 0.3, reduce_to = 'lower')
 
     samples, vec = create_samples.createSamples(d_small, perc_samples)
-    voronoi = voronoi.getVoronoi(d_small.shape, samples, vec)
-    linear = rbf_interpolation.interpolate(d_small.shape, samples, vec, ftype='linear')
+    titles = [('voronoi', 'Nearest Neighbor (Voronoi)'), \
+        ('natural_neighbor', 'Natural Neighbor'), ('rbf', 'Linear RBF')]
 
-    figsize = (9, 2.5)
+    figsize = (3 * (len(titles) + 1), 2.5)
     plt.figure(figsize = figsize)
 
-    plt.subplot(1, 3, 1)
+    plt.subplot(1, len(titles) + 1, 1)
     plt.title('Scaled Depth')
     plt.imshow(d_small, cmap='plasma')
     plt.colorbar(fraction = 0.046, pad = 0.04)
 
-    plt.subplot(1, 3, 2)
-    plt.title('Natural Neighbor')
-    plt.imshow(voronoi, cmap='plasma')
-    plt.colorbar(fraction = 0.046, pad = 0.04)
-
-    plt.subplot(1, 3, 3)
-    plt.title('Linear RBF')
-    plt.imshow(linear, cmap='plasma')
-    plt.colorbar(fraction = 0.046, pad = 0.04)
+    timer = LatencyTracker()
+    for i, (name, title) in enumerate(titles):
+        filled, confidence = backends.complete(name, d_small, samples = samples, vec = vec, timer = timer)
+        plt.subplot(1, len(titles) + 1, i + 2)
+        plt.title(title)
+        plt.imshow(filled, cmap='plasma')
+        plt.colorbar(fraction = 0.046, pad = 0.04)
 
+    print(timer.report())
     plt.subplots_adjust(wspace = 0.45)
     plt.show()
 